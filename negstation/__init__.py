@@ -1 +1,6 @@
-from .negstation import EditorManager as NegStation
\ No newline at end of file
+def __getattr__(name):
+    # Import the GUI lazily so headless tools don't need a display stack
+    if name == "NegStation":
+        from .negstation import EditorManager
+        return EditorManager
+    raise AttributeError(f"module 'negstation' has no attribute '{name}'")
\ No newline at end of file
@@ -0,0 +1,196 @@
+import argparse
+import json
+import logging
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from .image_files import SOURCE_EXTENSIONS
+from .processing import (
+    crop_rect, invert, load_image, monochrome, orient, rotate_and_crop, save_image)
+
+logger = logging.getLogger(__name__)
+
+
+def load_chain(layout: dict, stage=None):
+    """
+    Resolves the widgets producing a stage of a saved layout. stage is a
+    stage id or name, by default the input of the Export Image widget is
+    used. Returns the (widget_type, config) pairs of the chain, source first.
+    """
+    stages = {int(k): v for k, v in layout["pipeline_order"].items()}
+    producers = {}
+    for widget in layout["widgets"]:
+        stage_out = widget["config"].get("pipeline_config", {}).get("stage_out")
+        if stage_out is not None:
+            producers[stage_out] = widget
+
+    if stage is None:
+        exports = [
+            w["config"]["pipeline_config"]["stage_in"]
+            for w in layout["widgets"]
+            if w["widget_type"] == "ExportStage"
+        ]
+        stage = next((s for s in exports if s in producers), None)
+        if stage is None:
+            raise ValueError("No Export Image widget connected to a stage, use --stage")
+    elif str(stage).isdigit():
+        stage = int(stage)
+    else:
+        by_name = {name: sid for sid, name in stages.items()}
+        if stage not in by_name:
+            raise ValueError(f"Unknown stage '{stage}'")
+        stage = by_name[stage]
+
+    chain = []
+    sid = stage
+    while sid is not None:
+        if sid not in producers or len(chain) > len(producers):
+            raise ValueError(f"Stage {sid} has no producing widget")
+        widget = producers[sid]
+        chain.append((widget["widget_type"], widget["config"]))
+        sid = widget["config"]["pipeline_config"].get("stage_in")
+    chain.reverse()
+
+    if chain[0][0] not in SOURCE_EXTENSIONS:
+        raise ValueError(f"Chain starts at '{chain[0][0]}', not at an open widget")
+    return chain
+
+
+def load_source(widget_type: str, config: dict, path: str):
+    if widget_type in ("OpenRawWidget", "TetherWidget"):
+        # Only import rawpy when RAW files are processed
+        from .raw_decoder import decode_raw, default_raw_config, parse_raw_config
+
+        rawconfig = default_raw_config()
+        rawconfig.update(parse_raw_config(config.get("raw_config", {})))
+        return decode_raw(path, rawconfig)
+    return load_image(path)
+
+
+def run_stage(widget_type: str, config: dict, img):
+    """Applies one stage with the parameters saved by its widget"""
+    if widget_type == "InvertStage":
+        return invert(img)
+    if widget_type == "MonochromeStage":
+        return monochrome(img)
+    if widget_type == "OrientationStage":
+        orient_cfg = config.get("orientation", {})
+        return orient(
+            img,
+            int(orient_cfg.get("rotation", 0)),
+            orient_cfg.get("mirror_h", "False") == "True",
+            orient_cfg.get("mirror_v", "False") == "True",
+        )
+    if widget_type == "FramingWidget":
+        angle = float(config.get("framing", {}).get("angle", 0.0))
+        h, w = img.shape[:2]
+        return rotate_and_crop(img, angle, (0, 0, w, h))
+    if widget_type == "CropWidget":
+        if "crop" not in config:
+            logger.warning("Layout was saved without the crop rectangle, not cropping")
+            return img
+        crop_cfg = config["crop"]
+        if not (crop_cfg.get("start") and crop_cfg.get("end") and crop_cfg.get("shape")):
+            # Nothing selected, the widget passes the image through as well
+            return img
+        x0, y0, x1, y1 = crop_rect(
+            crop_cfg["start"], crop_cfg["end"], crop_cfg["shape"], img.shape)
+        return img[y0:y1, x0:x1]
+    raise ValueError(f"Stage '{widget_type}' can't run headless")
+
+
+def process_file(path: str, chain: list, out_path: str):
+    """Runs the full-res chain over one file, returns (seconds, megapixels)"""
+    start = time.perf_counter()
+    img = load_source(*chain[0], path)
+    megapixels = img.shape[0] * img.shape[1] / 1e6
+    for widget_type, config in chain[1:]:
+        img = run_stage(widget_type, config, img)
+    save_image(img, out_path)
+    return time.perf_counter() - start, megapixels
+
+
+def output_names(files: list, ext: str):
+    """
+    Returns the output file name of every input file. Inputs sharing a stem,
+    e.g. a.nef and a.tif, keep their extension in the name so they don't
+    overwrite each other.
+    """
+    stems = Counter(p.stem for p in files)
+    return [
+        f"{p.stem}_{p.suffix[1:].lower()}.{ext}" if stems[p.stem] > 1 else f"{p.stem}.{ext}"
+        for p in files
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run a saved NegStation pipeline over a directory of scans")
+    parser.add_argument("input_dir", help="directory with RAW or image files")
+    parser.add_argument("output_dir", help="directory for the exported images")
+    parser.add_argument("--layout", default="negstation_widgets.json",
+                        help="saved widget layout holding the pipeline")
+    parser.add_argument("--stage", default=None,
+                        help="stage id or name to export, default: Export Image input")
+    parser.add_argument("--format", default="tif",
+                        help="output file extension (tif, png, jpg)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="number of worker processes")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+
+    with open(args.layout, "r") as f:
+        layout = json.load(f)
+    try:
+        chain = load_chain(layout, args.stage)
+    except ValueError as e:
+        logger.error(str(e))
+        return 1
+    logger.info("Pipeline: " + " -> ".join(t for t, _ in chain))
+
+    extensions = SOURCE_EXTENSIONS[chain[0][0]]
+    files = sorted(
+        p for p in Path(args.input_dir).iterdir()
+        if p.suffix.lower() in extensions
+    )
+    if not files:
+        logger.error(f"No {', '.join(sorted(extensions))} files in '{args.input_dir}'")
+        return 1
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    total_mp = 0.0
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {
+            pool.submit(
+                process_file,
+                str(path),
+                chain,
+                os.path.join(args.output_dir, name),
+            ): path
+            for path, name in zip(files, output_names(files, args.format))
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                seconds, megapixels = future.result()
+            except Exception as e:
+                failed += 1
+                logger.error(f"{path.name}: failed: {e}")
+            else:
+                total_mp += megapixels
+                logger.info(f"{path.name}: {seconds:.2f}s ({megapixels:.1f} MP)")
+
+    elapsed = time.perf_counter() - start
+    done = len(files) - failed
+    logger.info(
+        f"Processed {done}/{len(files)} files in {elapsed:.1f}s: "
+        f"{done / elapsed * 60:.1f} files/min, {total_mp / elapsed:.1f} MP/s"
+    )
+    return 1 if failed else 0
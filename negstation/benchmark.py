@@ -0,0 +1,196 @@
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from .processing import (
+    compute_histograms, invert, monochrome, orient, rotate_and_crop, to_texture_data
+)
+
+logger = logging.getLogger(__name__)
+
+# (width, height) of the synthetic images, 3:2 like a 35mm frame
+SIZES = {
+    "preview": (500, 333),
+    "24mp": (6000, 4000),
+    "45mp": (8256, 5504),
+    "100mp": (11648, 8736),
+}
+
+STAGES = {
+    "invert": invert,
+    "monochrome": monochrome,
+    "orientation": lambda img: orient(img, 90, True, False),
+    "framing": lambda img: rotate_and_crop(
+        img, 2.5, (0, 0, img.shape[1], img.shape[0])),
+    "histogram": compute_histograms,
+    # Only the conversion to DearPyGui texture data, not the GPU upload
+    "texture_data": to_texture_data,
+}
+
+# The full chain of a typical negative scan, from the opened image on
+CHAIN = ("invert", "orientation", "framing", "monochrome", "histogram")
+
+# Stages too slow to run at full-res, they only run on the preview
+PREVIEW_ONLY = {"texture_data"}
+
+
+def synthetic_image(width: int, height: int, seed: int = 0):
+    """RGBA float32 test image with a gradient and noise"""
+    rng = np.random.default_rng(seed)
+    img = np.empty((height, width, 4), dtype=np.float32)
+    img[..., :3] = rng.random((height, width, 3), dtype=np.float32)
+    img[..., 0] *= np.linspace(0.0, 1.0, width, dtype=np.float32)
+    img[..., 3] = 1.0
+    img.flags.writeable = False
+    return img
+
+
+def measure(fn: callable, img: np.ndarray, repeat: int):
+    """
+    Returns the best wall time and the peak traced allocation in bytes. The
+    memory is traced in a separate run as tracing slows down allocations.
+    """
+    tracemalloc.start()
+    fn(img)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(img)
+        best = min(best, time.perf_counter() - start)
+    return best, peak
+
+
+def run_chain(img: np.ndarray):
+    for name in CHAIN:
+        img = STAGES[name](img)
+    return img
+
+
+def run(sizes: list, repeat: int):
+    results = {}
+    for size in sizes:
+        width, height = SIZES[size]
+        img = synthetic_image(width, height)
+        logger.info(f"{size}: {width}x{height}")
+        for name, fn in STAGES.items():
+            if size != "preview" and name in PREVIEW_ONLY:
+                continue
+            seconds, peak = measure(fn, img, repeat)
+            results[f"{size}/{name}"] = {"seconds": seconds, "peak_bytes": peak}
+            logger.info(f"  {name:<12} {seconds * 1000:10.1f} ms {peak / 1024**2:10.1f} MiB")
+        seconds, peak = measure(run_chain, img, repeat)
+        results[f"{size}/chain"] = {"seconds": seconds, "peak_bytes": peak}
+        logger.info(f"  {'chain':<12} {seconds * 1000:10.1f} ms {peak / 1024**2:10.1f} MiB")
+    return results
+
+
+# Run in a fresh interpreter, imports are cached after the first time
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from negstation.negstation import EditorManager
+manager = EditorManager()
+manager._discover_and_register_widgets(sys.argv[1])
+print(json.dumps({
+    "seconds": time.perf_counter() - start,
+    "modules": [m for m in ("rawpy", "scipy", "PIL") if m in sys.modules],
+}))
+"""
+
+
+def measure_startup(repeat: int):
+    """Returns the best time to import the editor and discover its widgets"""
+    package_dir = os.path.dirname(os.path.realpath(__file__))
+    best = None
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT, os.path.join(package_dir, "widgets")],
+            cwd=os.path.dirname(package_dir),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        result = json.loads(out.stdout.splitlines()[-1])
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    logger.info(
+        f"startup: {best['seconds'] * 1000:.1f} ms, heavy modules loaded: "
+        f"{', '.join(best['modules']) or 'none'}"
+    )
+    return {"startup/discovery": {"seconds": best["seconds"], "peak_bytes": 0}}
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """Logs the change against a baseline, returns the regressed benchmarks"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        time_ratio = result["seconds"] / max(base["seconds"], 1e-9)
+        mem_ratio = result["peak_bytes"] / max(base["peak_bytes"], 1)
+        regressed = time_ratio > 1 + tolerance or mem_ratio > 1 + tolerance
+        if regressed:
+            regressions.append(name)
+        logger.log(
+            logging.WARNING if regressed else logging.INFO,
+            f"{name:<20} time x{time_ratio:5.2f}  memory x{mem_ratio:5.2f}"
+            + ("  REGRESSION" if regressed else ""),
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark NegStation pipeline stages on synthetic images")
+    parser.add_argument("--sizes", default="preview,24mp",
+                        help=f"comma separated sizes out of {', '.join(SIZES)}")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per benchmark, the fastest is reported")
+    parser.add_argument("--baseline", default=None,
+                        help="JSON results of an earlier run to compare against")
+    parser.add_argument("--save", default=None,
+                        help="write the results as JSON, e.g. as a new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative slowdown before reporting a regression")
+    parser.add_argument("--startup", action="store_true",
+                        help="also measure the editor startup, needs dearpygui")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+
+    sizes = args.sizes.split(",")
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        logger.error(f"Unknown sizes: {', '.join(unknown)}")
+        return 1
+
+    results = run(sizes, args.repeat)
+    if args.startup:
+        try:
+            results.update(measure_startup(args.repeat))
+        except subprocess.CalledProcessError as e:
+            logger.error(f"Startup measurement failed: {e.stderr.strip()}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=4)
+        logger.info(f"Results written to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
@@ -0,0 +1,157 @@
+import logging
+import os
+import threading
+import time
+
+from .image_files import SOURCE_EXTENSIONS
+
+
+class CameraBackend:
+    """A camera that captures images and returns the files as bytes"""
+
+    name = "camera"
+
+    def capture(self):
+        """Triggers a capture, returns (file name, file data)"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class GPhoto2Camera(CameraBackend):
+    """The first camera found by gphoto2"""
+
+    name = "gphoto2"
+
+    def __init__(self):
+        # Only needed when tethering to a real camera
+        import gphoto2 as gp
+
+        self.gp = gp
+        self.camera = gp.Camera()
+        self.camera.init()
+
+    def capture(self):
+        gp = self.gp
+        path = self.camera.capture(gp.GP_CAPTURE_IMAGE)
+        camera_file = self.camera.file_get(
+            path.folder, path.name, gp.GP_FILE_TYPE_NORMAL
+        )
+        return path.name, bytes(camera_file.get_data_and_size())
+
+    def close(self):
+        self.camera.exit()
+
+
+class DirectoryCamera(CameraBackend):
+    """
+    Fake camera replaying the RAW files of a directory in order, starting
+    over at the end. delay simulates the exposure and transfer time.
+    """
+
+    name = "directory"
+
+    def __init__(self, directory: str, delay: float = 0.0):
+        extensions = SOURCE_EXTENSIONS["OpenRawWidget"]
+        self.files = sorted(
+            os.path.join(directory, name)
+            for name in os.listdir(directory)
+            if os.path.splitext(name)[1].lower() in extensions
+        )
+        if not self.files:
+            raise ValueError(f"No RAW files in '{directory}'")
+        self.delay = delay
+        self.index = 0
+
+    def capture(self):
+        path = self.files[self.index % len(self.files)]
+        self.index += 1
+        if self.delay:
+            time.sleep(self.delay)
+        with open(path, "rb") as f:
+            return os.path.basename(path), f.read()
+
+
+def open_camera(source: str, delay: float = 0.0):
+    """'gphoto2' for a real camera, otherwise a directory for a fake camera"""
+    if source == "gphoto2":
+        return GPhoto2Camera()
+    return DirectoryCamera(source, delay)
+
+
+class CaptureSession:
+    """
+    Captures frames on its own thread and saves them to out_dir. Every saved
+    file is handed to on_frame(path), which should only queue the decoding
+    so the next capture starts while the previous frame is decoded.
+    """
+
+    def __init__(
+        self,
+        camera: CameraBackend,
+        out_dir: str,
+        on_frame: callable,
+        logger: logging.Logger,
+    ):
+        self.camera = camera
+        self.out_dir = out_dir
+        self.on_frame = on_frame
+        self.logger = logger
+        self.captured = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, count: int):
+        """Captures count frames in the background"""
+        if self.is_running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._capture_loop, args=(count,), daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stops after the capture in progress"""
+        self._stop.set()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def close(self):
+        self.stop()
+        if self._thread is not None:
+            self._thread.join()
+        self.camera.close()
+
+    def _capture_loop(self, count: int):
+        os.makedirs(self.out_dir, exist_ok=True)
+        for i in range(count):
+            if self._stop.is_set():
+                break
+            start = time.perf_counter()
+            try:
+                name, data = self.camera.capture()
+                path = self._save(name, data)
+            except Exception as e:
+                self.logger.error(f"Capture failed: {e}")
+                break
+            self.captured += 1
+            self.logger.info(
+                f"Captured {os.path.basename(path)} ({i + 1}/{count}) "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
+            self.on_frame(path)
+
+    def _save(self, name: str, data: bytes):
+        """Writes a captured file without overwriting earlier captures"""
+        stem, ext = os.path.splitext(name)
+        path = os.path.join(self.out_dir, name)
+        n = 1
+        while os.path.exists(path):
+            path = os.path.join(self.out_dir, f"{stem}_{n}{ext}")
+            n += 1
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
@@ -0,0 +1,148 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(base, "negstation", "decoded")
+
+
+def file_key(path: str):
+    """Identifies a file version, a changed file gets a new key"""
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+class DiskCache:
+    """
+    Persistent cache of decoded images as .npy files, which are memory-mapped
+    when read so only the accessed parts of an image are loaded. Entries are
+    keyed by a hash of the file content and the decoding parameters. When the
+    cache grows over max_bytes the least recently used entries are deleted.
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = 20 * 1024**3):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # (path, mtime, size) -> content hash, hashing a file is not free
+        self._file_hashes = {}
+        os.makedirs(self.directory, exist_ok=True)
+
+    def file_hash(self, path: str):
+        stamp = file_key(path)
+        digest = self._file_hashes.get(stamp)
+        if digest is None:
+            h = hashlib.blake2b(digest_size=16)
+            with open(path, "rb") as f:
+                while chunk := f.read(4 * 1024**2):
+                    h.update(chunk)
+            digest = h.hexdigest()
+            self._file_hashes[stamp] = digest
+        return digest
+
+    def key(self, path: str, params):
+        """Returns the cache key of a file decoded with params (repr-able)"""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(self.file_hash(path).encode())
+        h.update(repr(params).encode())
+        return h.hexdigest()
+
+    def version_key(self, path: str, params):
+        """
+        Returns a cache key of data derived from a file version, identified by
+        its path, modification time and size. Unlike key() the file isn't
+        read, for files which are used in place.
+        """
+        h = hashlib.blake2b(digest_size=16)
+        h.update(repr((file_key(path), params)).encode())
+        return h.hexdigest()
+
+    def _entry_path(self, key: str):
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def get(self, key: str):
+        """Returns the read-only memory-mapped image, or None"""
+        path = self._entry_path(key)
+        try:
+            img = np.load(path, mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            return None
+        try:
+            # The modification time orders the entries for cleanup
+            os.utime(path)
+        except OSError:
+            # Removed by a concurrent cleanup, the memory map is still valid
+            pass
+        return img
+
+    def put(self, key: str, img: np.ndarray):
+        """Stores an image and returns it memory-mapped from the cache"""
+        path = self._entry_path(key)
+        # Written through a file object, np.save would append .npy to the
+        # name and cleanup() would see the unfinished file as an entry
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, np.ascontiguousarray(img), allow_pickle=False)
+        # Mapped before it is visible to cleanup() in other threads, the
+        # memory map stays valid when the file is renamed or removed
+        img = np.load(tmp, mmap_mode="r")
+        os.replace(tmp, path)
+        self.cleanup(keep=path)
+        return img
+
+    def _entries(self):
+        """Returns (mtime, size, path) of all entries"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npy"):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    # Removed since listing the directory
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def cleanup(self, keep: str = None):
+        """
+        Deletes the least recently used entries until the cap is met, except
+        the entry at path keep
+        """
+        with self.lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    # Open memory maps stay valid after the file is removed
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+
+    def get_stats(self):
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "bytes_held": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+
+_disk_cache = None
+
+
+def get_disk_cache():
+    """The disk cache shared by all sources of this process"""
+    global _disk_cache
+    if _disk_cache is None:
+        _disk_cache = DiskCache()
+    return _disk_cache
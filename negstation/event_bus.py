@@ -2,56 +2,284 @@ import threading
 import queue
 import logging
 import inspect
+import itertools
+import json
+import time
 import types
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BusStats:
+    """Thread safe timing statistics of the event bus, in seconds"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = {}
+
+    def record(self, category: str, name: str, seconds: float):
+        with self.lock:
+            stat = self.timings.setdefault(category, {}).setdefault(
+                name, {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0}
+            )
+            stat["count"] += 1
+            stat["total"] += seconds
+            stat["max"] = max(stat["max"], seconds)
+            stat["last"] = seconds
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                category: {
+                    name: dict(stat, avg=stat["total"] / stat["count"])
+                    for name, stat in stats.items()
+                }
+                for category, stats in self.timings.items()
+            }
+
+    def reset(self):
+        with self.lock:
+            self.timings.clear()
 
 
 class EventBus:
-    def __init__(self, logger: logging.Logger):
+    def __init__(self, logger: logging.Logger, workers: int = None):
         self.logger = logger
         self.subscribers = {}
         self.event_queue = queue.Queue()
         self.main_queue = queue.Queue()
+
+        # Worker pool for heavy handlers, jobs are serialized per owner
+        self.worker_pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="negstation-worker"
+        )
+        self._worker_jobs = {}
+        self._job_counter = itertools.count()
+
+        # Coalesced event types: event_type -> key function (or None)
+        self.coalesced = {}
+        # Latest pending payload per coalescing key, for both queues
+        self._pending_events = {}
+        self._pending_main = {}
+        self._pending_lock = threading.Lock()
+        # Number of superseded payloads per event type
+        self.dropped_events = {}
+        # Queue latencies per event type and execution time per handler
+        self.stats = BusStats()
+
         threading.Thread(target=self._dispatch_loop, daemon=True).start()
 
-    def subscribe(self, event_type: str, callback: callable, main_thread: bool = False):
+    def subscribe(
+        self,
+        event_type: str,
+        callback: callable,
+        main_thread: bool = False,
+        worker: bool = False,
+    ):
+        """
+        Handlers run on the dispatch thread by default. main_thread handlers
+        are queued for the render loop, worker handlers run on the worker
+        pool where calls for the same owner instance never overlap.
+        """
         self.logger.debug(f"Subscribed to {event_type}")
-        self.subscribers.setdefault(event_type, []).append((callback, main_thread))
+        target = "main" if main_thread else ("worker" if worker else None)
+        self.subscribers.setdefault(event_type, []).append((callback, target))
+
+    def set_coalescing(self, event_type: str, key: callable = None):
+        """
+        Only dispatch the newest pending payload of an event type. If key is
+        given it is called with the payload and events are coalesced per
+        returned key (e.g. per pipeline stage id) instead of per type.
+        """
+        self.coalesced[event_type] = key
+
+    def get_dropped_counts(self):
+        with self._pending_lock:
+            return dict(self.dropped_events)
+
+    def get_stats(self):
+        """
+        Returns the current queue depths and timing statistics: time from
+        publishing until the dispatch loop picks an event up, until a main
+        thread or worker handler starts, and how long each handler runs.
+        """
+        with self._pending_lock:
+            worker_jobs = sum(len(jobs) for jobs in self._worker_jobs.values())
+            dropped = dict(self.dropped_events)
+        return {
+            "event_queue_depth": self.event_queue.qsize(),
+            "main_queue_depth": self.main_queue.qsize(),
+            "worker_jobs_pending": worker_jobs,
+            "dropped_events": dropped,
+            **self.stats.snapshot(),
+        }
+
+    def dump_stats(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.get_stats(), f, indent=4)
+        self.logger.info(f"Event bus stats written to {path}")
+
+    def reset_stats(self):
+        self.stats.reset()
+        with self._pending_lock:
+            self.dropped_events.clear()
+
+    def _run_handler(self, callback: callable, data):
+        start = time.perf_counter()
+        try:
+            callback(data)
+        finally:
+            self.stats.record(
+                "handler_time", _handler_name(callback), time.perf_counter() - start
+            )
+
+    def _coalescing_key(self, event_type: str, data):
+        key_fn = self.coalesced[event_type]
+        return (event_type, key_fn(data) if key_fn else None)
+
+    def _count_dropped(self, event_type: str):
+        self.dropped_events[event_type] = self.dropped_events.get(event_type, 0) + 1
 
     def publish_deferred(self, event_type: str, data=None):
         self.logger.debug(f"publish {event_type}")
-        self.event_queue.put((event_type, data))
+        published = time.perf_counter()
+        if event_type not in self.coalesced:
+            self.event_queue.put((event_type, data, None, published))
+            return
+
+        key = self._coalescing_key(event_type, data)
+        with self._pending_lock:
+            if key in self._pending_events:
+                # Replace the stale payload, its queue slot is reused
+                self._count_dropped(event_type)
+                self._pending_events[key] = (data, published)
+                return
+            self._pending_events[key] = (data, published)
+        self.event_queue.put((event_type, None, key, published))
 
     def _dispatch_loop(self):
         while True:
-            event_type, data = self.event_queue.get()
+            event_type, data, key, published = self.event_queue.get()
+            if key is not None:
+                with self._pending_lock:
+                    data, published = self._pending_events.pop(key)
+            self.stats.record(
+                "dispatch_latency", event_type, time.perf_counter() - published
+            )
             self.logger.debug(f"Dispatching {event_type}")
-            for callback, main_thread in self.subscribers.get(event_type, []):
-                if main_thread:
-                    self.main_queue.put((callback, data))
+            for callback, target in self.subscribers.get(event_type, []):
+                if target == "main":
+                    self._put_main(callback, event_type, data, key, published)
+                elif target == "worker":
+                    self._put_worker(callback, event_type, data, key, published)
                 else:
                     try:
-                        callback(data)
+                        self._run_handler(callback, data)
                     except Exception as e:
                         self.logger.error(
-                            f"Error in background handler '{
-                                     event_type}': {e}"
+                            f"Error in background handler '{event_type}': {e}"
                         )
 
-    def process_main_queue(self):
+    def _put_main(self, callback: callable, event_type: str, data, key, published):
+        if key is None:
+            self.main_queue.put((callback, event_type, data, None, published))
+            return
+
+        main_key = (callback, key)
+        with self._pending_lock:
+            if main_key in self._pending_main:
+                self._count_dropped(event_type)
+                self._pending_main[main_key] = (data, published)
+                return
+            self._pending_main[main_key] = (data, published)
+        self.main_queue.put((callback, event_type, None, main_key, published))
+
+    def call_main(self, callback: callable, data=None):
+        """Run callback(data) in the render loop, e.g. for GUI updates"""
+        self._put_main(callback, "call_main", data, None, time.perf_counter())
+
+    def run_in_worker(self, callback: callable, data=None):
+        """Run callback(data) on the worker pool"""
+        self._put_worker(callback, "run_in_worker", data, None, time.perf_counter())
+
+    def _put_worker(self, callback: callable, event_type: str, data, key, published):
+        owner = callback.__self__ if inspect.ismethod(callback) else callback
+        with self._pending_lock:
+            jobs = self._worker_jobs.get(owner)
+            running = jobs is not None
+            if not running:
+                jobs = self._worker_jobs[owner] = {}
+            if key is None:
+                key = next(self._job_counter)
+            elif (callback, key) in jobs:
+                self._count_dropped(event_type)
+            jobs[(callback, key)] = (event_type, data, published)
+        if not running:
+            self.worker_pool.submit(self._run_worker_jobs, owner)
+
+    def _run_worker_jobs(self, owner):
         while True:
+            with self._pending_lock:
+                jobs = self._worker_jobs[owner]
+                if not jobs:
+                    del self._worker_jobs[owner]
+                    return
+                job = next(iter(jobs))
+                callback = job[0]
+                event_type, data, published = jobs.pop(job)
+            self.stats.record(
+                "worker_latency", event_type, time.perf_counter() - published
+            )
+            try:
+                self._run_handler(callback, data)
+            except Exception as e:
+                self.logger.error(f"Error in worker handler '{callback}': {e}")
+
+    def process_main_queue(self, budget: float = None):
+        """
+        Runs the queued main thread callbacks. With a budget in seconds it
+        stops once the budget is used up and leaves the rest for the next
+        call, at least one callback runs. Returns whether callbacks are left.
+        """
+        start = time.perf_counter()
+        ran = False
+        while not (ran and budget is not None and time.perf_counter() - start >= budget):
             try:
-                callback, data = self.main_queue.get_nowait()
-                callback(data)
+                callback, event_type, data, key, published = self.main_queue.get_nowait()
             except queue.Empty:
-                break
+                return False
+            ran = True
+            if key is not None:
+                with self._pending_lock:
+                    data, published = self._pending_main.pop(key)
+            self.stats.record(
+                "main_latency", event_type, time.perf_counter() - published
+            )
+            self._run_handler(callback, data)
+        return not self.main_queue.empty()
+
+    def is_idle(self):
+        """Whether no events, main thread callbacks or worker jobs are pending"""
+        with self._pending_lock:
+            workers_busy = bool(self._worker_jobs)
+        return not workers_busy and self.event_queue.empty() and self.main_queue.empty()
 
     def unsubscribe_instance(self, instance):
         for event_type, subs in list(self.subscribers.items()):
             new_subs = []
-            for callback, main_thread in subs:
+            for callback, target in subs:
                 # if it's a bound method to our instance, skip it
                 if inspect.ismethod(callback) and callback.__self__ is instance:
                     continue
-                new_subs.append((callback, main_thread))
+                new_subs.append((callback, target))
             if len(new_subs) != len(subs):
-                self.subscribers[event_type] = new_subs
\ No newline at end of file
+                self.subscribers[event_type] = new_subs
+        # Forget queued work, a running job stops after its current call
+        with self._pending_lock:
+            if instance in self._worker_jobs:
+                self._worker_jobs[instance].clear()
+
+
+def _handler_name(callback: callable):
+    if inspect.ismethod(callback):
+        return f"{type(callback.__self__).__name__}.{callback.__name__}"
+    return getattr(callback, "__qualname__", repr(callback))
@@ -0,0 +1,73 @@
+import time
+
+from .event_bus import EventBus
+
+
+class FrameScheduler:
+    """
+    Paces the render loop. Main thread callbacks get a time budget per frame
+    and the rest carries over to the next frame, widgets without pending
+    work aren't updated, and after idle_after seconds without input or
+    events frames are only rendered at idle_fps. Timed refreshes of widgets
+    happen at the idle frame rate as well.
+    """
+
+    def __init__(
+        self,
+        bus: EventBus,
+        main_budget: float = 0.008,
+        idle_fps: float = 10.0,
+        idle_after: float = 0.5,
+    ):
+        self.bus = bus
+        self.main_budget = main_budget
+        self.idle_fps = idle_fps
+        self.idle_after = idle_after
+        self.last_activity = time.perf_counter()
+        self._frame_start = self.last_activity
+        self.frames = 0
+        self.idle_frames = 0
+        self.carried_over = 0
+        self.updates_skipped = 0
+
+    def note_input(self, *args):
+        """Input handler callback, keeps rendering at full rate"""
+        self.last_activity = time.perf_counter()
+
+    def run_frame(self, widgets: list):
+        """Does the main thread work of a frame, before it is rendered"""
+        self._frame_start = time.perf_counter()
+        self.frames += 1
+        busy = self.bus.process_main_queue(self.main_budget)
+        if busy:
+            self.carried_over += 1
+        for w in widgets:
+            if w.has_update():
+                busy = True
+                w.update()
+            elif w.refresh_due():
+                w.update()
+            else:
+                self.updates_skipped += 1
+        if busy or not self.bus.is_idle():
+            self.last_activity = self._frame_start
+
+    def wait(self):
+        """
+        Sleeps after rendering a frame while idle, waking up early when
+        events or callbacks are queued
+        """
+        if time.perf_counter() - self.last_activity < self.idle_after:
+            return
+        self.idle_frames += 1
+        deadline = self._frame_start + 1.0 / self.idle_fps
+        while time.perf_counter() < deadline and self.bus.is_idle():
+            time.sleep(0.005)
+
+    def get_stats(self):
+        return {
+            "frames": self.frames,
+            "idle_frames": self.idle_frames,
+            "carried_over": self.carried_over,
+            "updates_skipped": self.updates_skipped,
+        }
@@ -0,0 +1,241 @@
+import logging
+import os
+
+import numpy as np
+
+from .strip_writers import to_output_dtype
+
+logger = logging.getLogger(__name__)
+
+TIFF_EXTENSIONS = (".tif", ".tiff")
+# File types opened by each source widget
+SOURCE_EXTENSIONS = {
+    "OpenRawWidget": {".nef", ".cr2", ".cr3", ".arw", ".dng", ".raf", ".orf", ".rw2"},
+    "OpenImageWidget": {".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff"},
+}
+# Captured frames are RAW files as well
+SOURCE_EXTENSIONS["TetherWidget"] = SOURCE_EXTENSIONS["OpenRawWidget"]
+
+
+def _is_tiff(path: str):
+    return os.path.splitext(path)[1].lower() in TIFF_EXTENSIONS
+
+
+def _to_rgb(img: np.ndarray):
+    """Returns an H x W x C image as RGB or RGBA in uint8 or uint16"""
+    if img.ndim == 2:
+        img = img[..., None]
+    if img.shape[2] in (1, 2):
+        # Grey, with or without alpha
+        img = img[..., [0, 0, 0, 1][: img.shape[2] + 2]]
+    img = img[..., :4]
+    if img.dtype not in (np.uint8, np.uint16):
+        img = to_output_dtype(img, ".tif")
+    return img
+
+
+def _mappable(page):
+    """Whether the samples of a TIFF page can be used as they are stored"""
+    return (
+        page.compression == 1
+        and page.predictor == 1
+        # MINISBLACK and RGB, other photometrics need converting
+        and page.photometric in (1, 2)
+        and page.sampleformat == 1
+        and page.bitspersample in (8, 16)
+        and page.samplesperpixel in (1, 3, 4)
+    )
+
+
+def _contiguous(offsets, counts):
+    return all(
+        offsets[i] + counts[i] == offsets[i + 1] for i in range(len(offsets) - 1)
+    )
+
+
+class ChunkedTiff:
+    """
+    Read-only array view of an uncompressed TIFF stored as tiles or as strips
+    scattered in the file. The file is memory-mapped and slicing only copies
+    the chunks overlapping the requested rows and columns.
+    """
+
+    ndim = 3
+
+    def __init__(self, path: str, page, byteorder: str):
+        self.data = np.memmap(path, np.uint8, "r")
+        self.file_dtype = np.dtype(page.dtype).newbyteorder(byteorder)
+        self.dtype = self.file_dtype.newbyteorder("=")
+        self.samples = page.samplesperpixel
+        self.planar = page.planarconfig == 2
+        self.tiled = page.is_tiled
+        h, w = page.imagelength, page.imagewidth
+        # Grey images are read as RGB
+        self.shape = (h, w, 3 if self.samples == 1 else self.samples)
+        if self.tiled:
+            self.chunk = (page.tilelength, page.tilewidth)
+        else:
+            self.chunk = (min(page.rowsperstrip, h), w)
+        self.down = -(-h // self.chunk[0])
+        self.across = -(-w // self.chunk[1])
+        self.offsets = page.dataoffsets
+        self.counts = page.databytecounts
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        img = self._read(0, self.shape[0], 0, self.shape[1])
+        return img if dtype is None else img.astype(dtype)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis or k is None for k in key[:2]):
+            return np.asarray(self)[key]
+        key = key + (slice(None),) * (2 - len(key))
+        (y0, y1), rows = _span(key[0], self.shape[0])
+        (x0, x1), cols = _span(key[1], self.shape[1])
+        return self._read(y0, y1, x0, x1)[(rows, cols) + key[2:]]
+
+    def _chunk(self, ty: int, tx: int, plane: int):
+        """The stored chunk at a tile row and column, as a H x W x S view"""
+        ch, cw = self.chunk
+        # The last strip only holds the remaining rows, tiles are padded
+        rows = ch if self.tiled else min(ch, self.shape[0] - ty * ch)
+        per_pixel = 1 if self.planar else self.samples
+        index = plane * self.down * self.across + ty * self.across + tx
+        start = self.offsets[index]
+        size = rows * cw * per_pixel * self.file_dtype.itemsize
+        return self.data[start:start + size].view(self.file_dtype).reshape(rows, cw, per_pixel)
+
+    def _read(self, y0: int, y1: int, x0: int, x1: int):
+        out = np.empty((y1 - y0, x1 - x0, self.samples), dtype=self.dtype)
+        ch, cw = self.chunk
+        for ty in range(y0 // ch, -(-y1 // ch)):
+            cy = ty * ch
+            sy0, sy1 = max(y0, cy), min(y1, cy + ch)
+            for tx in range(x0 // cw, -(-x1 // cw)):
+                cx = tx * cw
+                sx0, sx1 = max(x0, cx), min(x1, cx + cw)
+                dest = out[sy0 - y0:sy1 - y0, sx0 - x0:sx1 - x0]
+                for plane in range(self.samples if self.planar else 1):
+                    chunk = self._chunk(ty, tx, plane)[sy0 - cy:sy1 - cy, sx0 - cx:sx1 - cx]
+                    if self.planar:
+                        dest[..., plane] = chunk[..., 0]
+                    else:
+                        dest[...] = chunk
+        if self.samples == 1:
+            return np.broadcast_to(out, out.shape[:2] + (3,))
+        return out
+
+
+def _span(index, n: int):
+    """
+    Returns the (start, stop) range read for an index of an axis of size n,
+    and the index to apply to that range
+    """
+    if isinstance(index, slice):
+        start, stop, step = index.indices(n)
+        if step < 0:
+            return (0, n), index
+        if start >= stop:
+            return (0, 0), slice(0, 0)
+        last = start + (stop - start - 1) // step * step
+        return (start, last + 1), slice(None, None, step)
+    index = int(index)
+    if index < 0:
+        index += n
+    if not 0 <= index < n:
+        raise IndexError(f"index {index} is out of bounds for size {n}")
+    return (index, index + 1), 0
+
+
+def map_image(path: str):
+    """
+    Memory-maps the first image of an uncompressed 8 or 16 bit TIFF file as
+    RGB or RGBA, nothing is read until pixels are accessed. Returns None for
+    files which have to be decoded with read_image().
+    """
+    if not _is_tiff(path):
+        return None
+    import tifffile
+
+    try:
+        with tifffile.TiffFile(path) as tif:
+            page = tif.pages.first
+            if not _mappable(page):
+                return None
+            if page.is_tiled or not _contiguous(page.dataoffsets, page.databytecounts):
+                return ChunkedTiff(path, page, tif.byteorder)
+            dtype = np.dtype(page.dtype).newbyteorder(tif.byteorder)
+            h, w, s = page.imagelength, page.imagewidth, page.samplesperpixel
+            offset = page.dataoffsets[0]
+    except Exception as e:
+        logger.warning(f"Can't memory-map '{path}': {e}")
+        return None
+
+    if page.planarconfig == 2:
+        img = np.moveaxis(np.memmap(path, dtype, "r", offset, (s, h, w)), 0, -1)
+    else:
+        img = np.memmap(path, dtype, "r", offset, (h, w, s))
+    if s == 1:
+        img = np.broadcast_to(img, (h, w, 3))
+    return img
+
+
+# Pillow decodes 16 bit colour PNGs to 8 bit, using the high byte of each
+# big endian sample. Its little endian unpackers take the second, low byte,
+# so decoding a file twice yields all 16 bits.
+_PNG16_LOW_BYTES = {"RGB;16B": "RGB;16L", "RGBA;16B": "RGBA;16L"}
+
+
+def _read_png16(im, path: str):
+    """Returns a 16 bit RGB or RGBA PNG opened with PIL as uint16, else None"""
+    from PIL import Image
+
+    if im.format != "PNG" or len(im.tile) != 1:
+        return None
+    codec, extents, offset, rawmode = im.tile[0]
+    if rawmode not in _PNG16_LOW_BYTES:
+        return None
+    high = np.asarray(im)
+    low_im = Image.open(path)
+    low_im.tile = [(codec, extents, offset, _PNG16_LOW_BYTES[rawmode])]
+    low = np.asarray(low_im)
+    return (high.astype(np.uint16) << 8) | low
+
+
+def read_image(path: str):
+    """
+    Decodes an image file as RGB or RGBA, uint16 for 16 bit files and uint8
+    otherwise
+    """
+    if _is_tiff(path):
+        import tifffile
+
+        try:
+            with tifffile.TiffFile(path) as tif:
+                page = tif.pages.first
+                if page.photometric in (1, 2):
+                    img = page.asarray()
+                    if page.planarconfig == 2 and img.ndim == 3:
+                        img = np.moveaxis(img, 0, -1)
+                    return _to_rgb(img)
+        except Exception as e:
+            # e.g. compressions which need the imagecodecs package
+            logger.warning(f"tifffile can't decode '{path}', using PIL: {e}")
+
+    # PIL is imported on first use, it slows down startup
+    from PIL import Image
+
+    im = Image.open(path)
+    if im.mode.startswith("I;16"):
+        # 16 bit grey
+        return _to_rgb(np.asarray(im).astype(np.uint16))
+    img = _read_png16(im, path)
+    if img is not None:
+        return img
+    if im.mode not in ("RGB", "RGBA"):
+        im = im.convert("RGBA" if im.has_transparency_data else "RGB")
+    return np.asarray(im)
@@ -1,15 +1,58 @@
+import itertools
+import threading
+import weakref
+
 import numpy as np
 
 from .event_bus import EventBus
+from .processing import convert_pixels, pyramid_level
+from .stage_cache import StageCache
 
 
 class ImagePipeline:
-    def __init__(self, bus: EventBus):
+    def __init__(
+        self,
+        bus: EventBus,
+        preview_budget: int = 512 * 1024**2,
+        full_res_budget: int = 4 * 1024**3,
+        pixel_dtype: str = "float32",
+        alpha: bool = True,
+    ):
         self.bus = bus
+        # Guards the stage graph and the bookkeeping below, which stage
+        # computations on the worker pool read and update concurrently
+        self.lock = threading.RLock()
+        # Storage format of published images, see set_pixel_format()
+        self.pixel_dtype = pixel_dtype
+        self.alpha = alpha
         self.id_counter = 0
         self.stages = {}
-        self.stagedata = {}
-        self.stagedata_full = {}
+        # Stage outputs, evicted stages are recomputed when requested
+        self.stagedata = StageCache(preview_budget)
+        self.stagedata_full = StageCache(full_res_budget)
+
+        # Stage graph: stage id -> id of the stage feeding it
+        self.stage_inputs = {}
+        # Stage id -> widget producing it, used for tiled execution
+        self.processors = {}
+        # Publish counter per (stage id, full_res)
+        self.versions = {}
+        # (input version, params) a stage last computed per (stage id, full_res)
+        self.computed = {}
+        # What the current version of a stage was published from, see publish()
+        self.published_from = {}
+        # Stages whose output is outdated by a parameter change upstream
+        self.dirty = set()
+        # Image pyramids of source stages, see set_pyramid()
+        self.pyramids = {}
+
+        # Newest generation started per (stage id, full_res). Every new
+        # source image, parameter change and stage computation starts a new
+        # generation, which is published along with its result.
+        self._generation_counter = itertools.count(1)
+        self.generations = {}
+        # Number of results dropped because a newer generation existed
+        self.stale_dropped = 0
 
     def load_stages(self, stages:dict):
         self.stages = stages
@@ -18,13 +61,22 @@ class ImagePipeline:
         self.id_counter = len(stages)
         for id, stage in self.stages.items():
             print(id, stage)
-            self.stagedata[id] = None
-            self.stagedata_full[id] = None
+
+    def set_pixel_format(self, dtype: str, alpha: bool):
+        """
+        Sets the format images are stored in between stages: float32, float16
+        or uint16, with or without alpha channel. RGB float16 takes 6 instead
+        of 16 bytes per pixel. Stages convert to float where they need to.
+        """
+        self.pixel_dtype = dtype
+        self.alpha = alpha
+        # Recompute everything in the new format, starting at the sources
+        for id, processor in list(self.processors.items()):
+            if not processor.has_pipeline_in:
+                processor.request_recompute(False)
 
     def register_stage(self, name: str):
         self.stages[self.id_counter] = name
-        self.stagedata[self.id_counter] = None
-        self.stagedata_full[self.id_counter] = None
         self.bus.publish_deferred("pipeline_stages", self.stages)
         self.id_counter += 1
         return self.id_counter-1
@@ -34,29 +86,221 @@ class ImagePipeline:
             self.stages[id] = name
             self.bus.publish_deferred("pipeline_stages", self.stages)
 
-    def publish(self, id: int, img: np.ndarray, full_res=False):
+    def connect(self, id: int, stage_in: int):
+        """Records that stage id is computed from stage stage_in"""
+        with self.lock:
+            if stage_in is None:
+                self.stage_inputs.pop(id, None)
+            else:
+                self.stage_inputs[id] = stage_in
+            for full_res in (False, True):
+                self.computed.pop((id, full_res), None)
+                self.published_from.pop((id, full_res), None)
+
+    def get_stage_input(self, id: int):
+        """Returns the id of the stage feeding stage id, None for sources"""
+        with self.lock:
+            return self.stage_inputs.get(id)
+
+    def set_processor(self, id: int, processor):
+        self.processors[id] = processor
+
+    def get_processor(self, id: int):
+        return self.processors.get(id)
+
+    def downstream(self, id: int):
+        """
+        Returns all stages fed directly or indirectly by stage id in
+        topological order. Every stage has a single input so the graph is a
+        forest and breadth-first order is a valid topological order.
+        """
+        with self.lock:
+            stage_inputs = list(self.stage_inputs.items())
+        children = {}
+        for sid, sin in stage_inputs:
+            children.setdefault(sin, []).append(sid)
+        order = []
+        seen = {id}
+        frontier = [id]
+        while frontier:
+            nxt = []
+            for sid in frontier:
+                for child in sorted(children.get(sid, [])):
+                    if child not in seen:
+                        seen.add(child)
+                        order.append(child)
+                        nxt.append(child)
+            frontier = nxt
+        return order
+
+    def mark_dirty(self, id: int):
+        """Marks stage id and everything downstream of it as outdated"""
+        with self.lock:
+            # Its next output differs even if computed from the same input
+            self.published_from.pop((id, False), None)
+            self.dirty.add(id)
+            self.dirty.update(self.downstream(id))
+
+    def is_dirty(self, id: int):
+        with self.lock:
+            return id in self.dirty
+
+    def should_compute(self, id: int, input_version: int, params=None, full_res=False):
+        """
+        Called by a stage before computing its output from the input image
+        with the given version. Returns False if the stage already computed
+        this exact input with the same params, its output is still valid.
+        """
+        key = (input_version, params)
+        with self.lock:
+            if id not in self.dirty and self.computed.get((id, full_res)) == key:
+                # Nothing upstream changed, so neither did anything downstream
+                self.dirty.difference_update(self.downstream(id))
+                return False
+            self.computed[(id, full_res)] = key
+            return True
+
+    def forget_computed(self, id: int, full_res=False, outdated=False):
+        """
+        Makes the next computation of stage id run even if its input and
+        params didn't change, e.g. to refill it after eviction. outdated
+        means the output will differ, so it is published with a new version.
+        """
+        with self.lock:
+            self.computed.pop((id, full_res), None)
+            if outdated:
+                self.published_from.pop((id, full_res), None)
+
+    def get_stage_version(self, id: int, full_res=False):
+        with self.lock:
+            return self.versions.get((id, full_res))
+
+    def new_generation(self, id: int, full_res=False):
+        """
+        Starts a new generation at stage id, e.g. for a newly loaded image, a
+        parameter change or a computation of the stage. Results of older
+        generations of this stage or of stages downstream are stale from now
+        on.
+        """
+        with self.lock:
+            generation = next(self._generation_counter)
+            self.generations[(id, full_res)] = generation
+        return generation
+
+    def get_generation(self, id: int, full_res=False):
+        with self.lock:
+            return self.generations.get((id, full_res), 0)
+
+    def is_stale(self, id: int, generation: int, full_res=False):
+        """
+        Returns True if a newer generation was started at stage id or at any
+        stage upstream of it, so work on the given generation will be
+        superseded and can be skipped.
+        """
+        seen = set()
+        with self.lock:
+            while id is not None and id not in seen:
+                if self.generations.get((id, full_res), 0) > generation:
+                    return True
+                seen.add(id)
+                id = self.stage_inputs.get(id)
+        return False
+
+    def publish(self, id: int, img: np.ndarray, full_res=False, generation=None):
+        """
+        Publishes a stage output. Images are shared with every consumer
+        without copying, so they are handed out as read-only views. A stage
+        must never modify its input in place and must not modify an image
+        after publishing it.
+
+        generation is the generation of the computation that produced the
+        image, sources leave it out to start a new one. Stale results are dropped, returns
+        whether the image got published.
+
+        The version is only bumped when the image can differ from the last
+        one, so a stage recomputed after eviction from unchanged input and
+        params, or a source republishing the same array, doesn't make the
+        stages downstream recompute.
+        """
         if img is None:
-            return
-        if full_res:
-            self.stagedata_full[id] = img.astype(np.float32)
-            self.bus.publish_deferred(
-                "pipeline_stage_full", (id, self.stagedata_full[id]))
-        else:
-            self.stagedata[id] = img.astype(np.float32)
-            self.bus.publish_deferred(
-                "pipeline_stage", (id, self.stagedata[id]))
+            return False
+        key = (id, full_res)
+        source = np.asarray(img)
+        dtype, alpha = self.pixel_dtype, self.alpha
+        # Only converts (and thereby copies) if the format doesn't match
+        img = convert_pixels(source, dtype, alpha)
+        if img.flags.writeable:
+            img = img.view()
+            img.flags.writeable = False
+        with self.lock:
+            if generation is None:
+                generation = self.new_generation(id, full_res)
+            elif self.is_stale(id, generation, full_res):
+                # Computed from outdated input, make sure the newer one is computed
+                self.computed.pop(key, None)
+                self.stale_dropped += 1
+                return False
+            else:
+                self.generations[key] = max(self.generations.get(key, 0), generation)
+            # Processing stages are identified by what they computed the
+            # image from, sources by the array they publish
+            origin = (self.computed.get(key), dtype, alpha)
+            last = self.published_from.get(key)
+            version = self.versions.get(key, 0)
+            if (last is None or last[0] != origin
+                    or (origin[0] is None and last[1]() is not source)):
+                version += 1
+                self.versions[key] = version
+                self.published_from[key] = (origin, weakref.ref(source))
+            # Stored and announced in version order
+            if full_res:
+                self.stagedata_full.put(id, img)
+                self.bus.publish_deferred(
+                    "pipeline_stage_full", (id, img, version, generation))
+            else:
+                self.stagedata.put(id, img)
+                self.dirty.discard(id)
+                self.bus.publish_deferred(
+                    "pipeline_stage", (id, img, version, generation))
+        return True
 
-    def get_stage_data(self, id: int):
-        if id in self.stagedata:
-            return self.stagedata[id]
-        else:
+    def set_pyramid(self, id: int, levels: list):
+        """
+        Sets the image pyramid of a source stage, level 0 being the largest.
+        Consumers can then pick the resolution they need.
+        """
+        self.pyramids[id] = levels
+
+    def get_pyramid_level(self, id: int, max_dim: int):
+        """
+        Returns the smallest pyramid level of stage id with its larger side
+        at least max_dim, or None if the stage has no pyramid. Levels can be
+        in any storage format, use to_float() before computing with them.
+        """
+        levels = self.pyramids.get(id)
+        if not levels:
             return None
-        
+        return pyramid_level(levels, max_dim)
+
+    def get_stage_data(self, id: int):
+        return self._get_cached(self.stagedata, id, False)
+
     def get_stage_data_full(self, id: int):
-        if id in self.stagedata_full:
-            return self.stagedata_full[id]
-        else:
-            return None
+        return self._get_cached(self.stagedata_full, id, True)
+
+    def _get_cached(self, cache: StageCache, id: int, full_res: bool):
+        img = cache.get(id)
+        if img is None and id in self.stages and self.get_stage_version(id, full_res):
+            # Evicted, ask the producing stage to publish it again
+            self.bus.publish_deferred("pipeline_recompute", (id, full_res))
+        return img
+
+    def get_cache_stats(self):
+        return {
+            "preview": self.stagedata.get_stats(),
+            "full_res": self.stagedata_full.get_stats(),
+            "stale_dropped": self.stale_dropped,
+        }
 
     def get_stage_name(self, id: int):
         if id in self.stages:
@@ -69,5 +313,14 @@ class ImagePipeline:
 
     def remove_stage(self, id: int):
         del self.stages[id]
-        del self.stagedata[id]
+        self.stagedata.discard(id)
+        self.stagedata_full.discard(id)
+        self.processors.pop(id, None)
+        self.pyramids.pop(id, None)
+        with self.lock:
+            self.stage_inputs.pop(id, None)
+            self.dirty.discard(id)
+            for full_res in (False, True):
+                self.generations.pop((id, full_res), None)
+                self.published_from.pop((id, full_res), None)
         self.republish_stages()
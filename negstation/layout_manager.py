@@ -22,6 +22,11 @@ class LayoutManager:
         dpg.save_init_file(self.INI_PATH)
         layout_data = {
             "pipeline_order" : { k:v  for k, v in self.manager.pipeline.stages.items() },
+            "pixel_format": {
+                "dtype": self.manager.pipeline.pixel_dtype,
+                "alpha": self.manager.pipeline.alpha,
+            },
+            "display_scale": self.manager.display_scale,
             "widgets": [
                 {"widget_type": type(w).__name__, "config": w.get_config()}
                 for w in self.manager.widgets
@@ -38,6 +43,11 @@ class LayoutManager:
         with open(self.WIDGET_DATA_PATH, "r") as f:
             layout_data = json.load(f)
 
+        pixel_format = layout_data.get("pixel_format", {})
+        self.manager.pipeline.pixel_dtype = pixel_format.get("dtype", "float32")
+        self.manager.pipeline.alpha = pixel_format.get("alpha", True)
+        self.manager.display_scale = float(layout_data.get("display_scale", 1.0))
+
         # Load all widgets
         widget_data = layout_data["widgets"]
         for data in widget_data:
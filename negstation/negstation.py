@@ -1,32 +1,48 @@
 import dearpygui.dearpygui as dpg
 import logging
 import os
-import importlib
-import inspect
 import sys
 import signal
+import time
 from pathlib import Path
 
 from .event_bus import EventBus
+from .frame_scheduler import FrameScheduler
 from .image_pipeline import ImagePipeline
+from .processing import PIXEL_DTYPES
 from .layout_manager import LayoutManager
-
-from .widgets.base_widget import BaseWidget
+from .widget_registry import WidgetSpec, scan_widgets
 
 logging.basicConfig(level=logging.INFO,
                     format="%(asctime)s %(levelname)s %(message)s")
 logger = logging.getLogger(__name__)
 
+# Choices of the View > Display scale menu
+DISPLAY_SCALES = (1.0, 1.25, 1.5, 2.0, 3.0)
+
 
 class EditorManager:
-    def __init__(self):
+    def __init__(self, workers: int = None):
+        self._start_time = time.perf_counter()
+        # Seconds spent in each startup step, logged with the first frame
+        self.startup_timings = {}
         dpg.create_context()
         self.texture_registry = dpg.add_texture_registry()
-        self.bus = EventBus(logger)
+        # workers: size of the pipeline stage thread pool, None for auto
+        self.bus = EventBus(logger, workers=workers)
+        # Only the newest pending drag/preview frame is worth processing
+        self.bus.set_coalescing("mouse_dragged")
+        self.bus.set_coalescing("img_dragged", key=lambda d: id(d["obj"]))
+        self.bus.set_coalescing("pipeline_stage", key=lambda d: d[0])
         self.pipeline = ImagePipeline(self.bus)
+        self.scheduler = FrameScheduler(self.bus)
         self.layout_manager = LayoutManager(self, logger)
         self.widgets = []
         self.widget_classes = {}
+        # Framebuffer pixels per window unit, above 1.0 on HiDPI displays.
+        # Viewers upload their textures at this resolution. Set from the
+        # View menu and saved with the layout.
+        self.display_scale = 1.0
 
     def _discover_and_register_widgets(self, directory="widgets"):
         logging.info(f"Discovering widgets in '{directory}' directory...")
@@ -40,69 +56,75 @@ class EditorManager:
             sys.path.insert(0, parent)
         pkg_name = dir_path.name  # e.g. 'widgets'
 
-        # 1) Load the package’s own BaseWidget
-        try:
-            base_mod = importlib.import_module(f"{pkg_name}.base_widget")
-            ModuleBaseWidget = getattr(base_mod, "BaseWidget")
-        except Exception:
-            ModuleBaseWidget = None
-
-        for py_file in dir_path.glob("*.py"):
-            if py_file.name.startswith("__"):
-                continue
-
-            module_name = f"{pkg_name}.{py_file.stem}"
-            try:
-                module = importlib.import_module(module_name)
-                for name, cls in inspect.getmembers(module, inspect.isclass):
-                    # 2) Use the BaseWidget defined *in* widgets/base_widget.py
-                    if (
-                        ModuleBaseWidget
-                        and issubclass(cls, ModuleBaseWidget)
-                        and cls is not ModuleBaseWidget
-                        and cls.register
-                    ):
-                        logging.info(
-                            f"  -> Found and registered widget: {name}")
-                        self._register_widget(name, cls)
-            except Exception as e:
-                logging.error(f"Failed to import widget '{py_file.name}': {e}")
-
-    def _register_widget(self, name: str, widget_class: object):
+        # Widget modules are only imported when a widget is first created
+        for spec in scan_widgets(dir_path, pkg_name):
+            logging.info(f"  -> Found and registered widget: {spec.class_name}")
+            self._register_widget(spec.class_name, spec)
+
+    def _register_widget(self, name: str, widget_class: WidgetSpec):
         if name in self.widget_classes:
             logging.warning(
                 f"Widget '{name}' is already registered. Overwriting.")
         self.widget_classes[name] = widget_class
 
     def _add_widget(self, widget_type: str, config: dict = {}):
-        WidgetClass = self.widget_classes[widget_type]
+        spec = self.widget_classes.get(widget_type)
+        if spec is None:
+            return
+        try:
+            WidgetClass = spec.load()
+        except Exception as e:
+            # e.g. a missing dependency, the widget isn't offered anymore
+            logging.error(f"Failed to import widget '{spec.module_name}': {e}")
+            del self.widget_classes[widget_type]
+            return
         instance = WidgetClass(self, logger)
         logger.info(f"Created instance: {str(instance)}")
         self.widgets.append(instance)
         instance.create()
         instance.set_config(config)
 
+    def _button_name(self, button: int):
+        return "right" if button == 0 else ("left" if button == 1 else "middle")
+
     def _on_drag(self, sender, app_data, user_data):
         self.bus.publish_deferred(
             "mouse_dragged",
             {
-                "button": (
-                    "right"
-                    if app_data[0] == 0
-                    else ("left" if app_data[0] == 1 else ("middle"))
-                ),
+                "button": self._button_name(app_data[0]),
                 "delta": (app_data[1], app_data[2]),
             },
         )
 
+    def _on_release(self, sender, app_data, user_data):
+        self.scheduler.note_input()
+        self.bus.publish_deferred(
+            "mouse_released", {"button": self._button_name(app_data)})
+
     def _on_scroll(self, sender, app_data, user_data):
         self.bus.publish_deferred("mouse_scrolled", app_data)
 
+    def _set_pixel_format(self, dtype: str, alpha: bool):
+        logger.info(f"Working format: {'RGBA' if alpha else 'RGB'} {dtype}")
+        self.pipeline.set_pixel_format(dtype, alpha)
+
+    def _set_display_scale(self, scale: float):
+        logger.info(f"Display scale: {scale}")
+        self.display_scale = scale
+        # Viewers upload their textures again at the new resolution
+        for w in self.widgets:
+            if hasattr(w, "needs_update"):
+                w.needs_update = True
+
     def setup(self):
+        start = time.perf_counter()
         self._discover_and_register_widgets(
             f"{os.path.dirname(os.path.realpath(__file__))}/widgets"
         )
+        self.startup_timings["discovery"] = time.perf_counter() - start
+        start = time.perf_counter()
         self.layout_manager.load_layout()
+        self.startup_timings["layout"] = time.perf_counter() - start
 
         dpg.create_viewport(title="NegStation", width=1200, height=800)
         dpg.configure_app(docking=True, docking_space=True)
@@ -118,10 +140,34 @@ class EditorManager:
                         "process_full_res", None
                     ),
                 )
+                dpg.add_menu_item(
+                    label="Run full-res pipeline (tiled)",
+                    callback=lambda: self.bus.publish_deferred(
+                        "process_full_res_tiled", None
+                    ),
+                )
                 dpg.add_menu_item(
                     label="Quit", callback=lambda: dpg.stop_dearpygui())
 
+            with dpg.menu(label="Pipeline"):
+                with dpg.menu(label="Working format"):
+                    for alpha in (True, False):
+                        for dtype in PIXEL_DTYPES:
+                            dpg.add_menu_item(
+                                label=f"{'RGBA' if alpha else 'RGB'} {dtype}",
+                                callback=lambda s, a, ud: self._set_pixel_format(*ud),
+                                user_data=(dtype, alpha),
+                            )
+
             with dpg.menu(label="View"):
+                with dpg.menu(label="Display scale"):
+                    for scale in DISPLAY_SCALES:
+                        dpg.add_menu_item(
+                            label=f"{scale:g}x",
+                            callback=lambda s, a, ud: self._set_display_scale(ud),
+                            user_data=scale,
+                        )
+                dpg.add_separator()
                 for widget_name in sorted(self.widget_classes.keys()):
                     dpg.add_menu_item(
                         label=self.widget_classes[widget_name].name,
@@ -140,6 +186,20 @@ class EditorManager:
                     callback=self._on_drag, threshold=1.0, button=2
                 )
                 dpg.add_mouse_wheel_handler(callback=self._on_scroll)
+                dpg.add_mouse_release_handler(callback=self._on_release)
+                # Any input keeps the render loop out of its idle frame rate
+                dpg.add_mouse_move_handler(callback=self.scheduler.note_input)
+                dpg.add_mouse_click_handler(callback=self.scheduler.note_input)
+                dpg.add_key_press_handler(callback=self.scheduler.note_input)
+
+    def _log_startup(self):
+        self.startup_timings["first_frame"] = time.perf_counter() - self._start_time
+        heavy = [m for m in ("rawpy", "scipy", "PIL", "gphoto2") if m in sys.modules]
+        logger.info(
+            "Startup: "
+            + ", ".join(f"{k} {v * 1000:.0f} ms" for k, v in self.startup_timings.items())
+            + f", modules loaded: {', '.join(heavy) or 'none'}"
+        )
 
     def run(self):
         self.setup()
@@ -147,11 +207,14 @@ class EditorManager:
         dpg.show_viewport()
 
         try:
+            first_frame = True
             while dpg.is_dearpygui_running():
-                self.bus.process_main_queue()
-                for w in self.widgets:
-                    w.update()
+                self.scheduler.run_frame(self.widgets)
                 dpg.render_dearpygui_frame()
+                if first_frame:
+                    first_frame = False
+                    self._log_startup()
+                self.scheduler.wait()
         except KeyboardInterrupt:
             logger.info("CTRL-C pressed: exiting...")
         dpg.destroy_context()
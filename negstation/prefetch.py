@@ -0,0 +1,106 @@
+import itertools
+import logging
+import mmap
+import os
+
+import numpy as np
+
+from .event_bus import EventBus
+from .stage_cache import StageCache
+
+
+def sibling_files(path: str, extensions: set):
+    """Returns the files next to path with one of the extensions, sorted"""
+    directory = os.path.dirname(os.path.abspath(path))
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if os.path.splitext(name)[1].lower() in extensions
+    )
+
+
+def step_file(path: str, extensions: set, step: int, count: int = 1):
+    """
+    Returns up to count files following path in its folder, step is 1 for
+    the next and -1 for the previous files
+    """
+    files = sibling_files(path, extensions)
+    path = os.path.abspath(path)
+    if path not in files:
+        return []
+    index = files.index(path)
+    found = []
+    for i in range(1, count + 1):
+        j = index + i * step
+        if 0 <= j < len(files):
+            found.append(files[j])
+    return found
+
+
+def _is_mapped(img):
+    """Whether an array is a memory-mapped file or a view of one"""
+    while isinstance(img, np.ndarray):
+        if isinstance(img, np.memmap):
+            return True
+        img = img.base
+    return isinstance(img, mmap.mmap)
+
+
+def pyramid_bytes(levels: list):
+    """Memory held by a pyramid, memory-mapped levels don't count"""
+    return sum(
+        l.nbytes for l in levels if isinstance(l, np.ndarray) and not _is_mapped(l)
+    )
+
+
+class Prefetcher:
+    """
+    Loads files in the background before they are opened, e.g. the next
+    scans of a roll. Results are kept in an LRU bounded by budget bytes.
+    Every prefetch() call replaces the previous request, files of an older
+    request that didn't start loading yet are skipped.
+    """
+
+    def __init__(
+        self,
+        bus: EventBus,
+        logger: logging.Logger,
+        budget: int = 1024**3,
+        sizeof: callable = pyramid_bytes,
+    ):
+        self.bus = bus
+        self.logger = logger
+        self.cache = StageCache(budget, sizeof)
+        self._request = 0
+        self._request_counter = itertools.count(1)
+
+    def load(self, key, loader: callable):
+        """Returns the prefetched value of key, or loads it now"""
+        value = self.cache.get(key)
+        if value is None:
+            value = loader()
+            self.cache.put(key, value)
+        return value
+
+    def prefetch(self, jobs: list):
+        """Loads (key, loader) jobs in order on the worker pool"""
+        self._request = next(self._request_counter)
+        self.bus.run_in_worker(self._run, (self._request, jobs))
+
+    def _run(self, data):
+        request, jobs = data
+        for key, loader in jobs:
+            if request != self._request:
+                # Superseded by a newer request
+                return
+            if self.cache.get(key) is not None:
+                continue
+            try:
+                self.cache.put(key, loader())
+            except Exception as e:
+                self.logger.warning(f"Prefetching {key} failed: {e}")
+            else:
+                self.logger.debug(f"Prefetched {key}")
+
+    def get_stats(self):
+        return self.cache.get_stats()
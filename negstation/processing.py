@@ -0,0 +1,338 @@
+import numpy as np
+
+from .image_files import map_image, read_image
+from .strip_writers import open_strip_writer
+
+
+# Storage dtypes pipeline images can be kept in, see convert_pixels()
+PIXEL_DTYPES = ("float32", "float16", "uint16")
+
+
+def to_float(img: np.ndarray):
+    """Returns the image as float32 in 0.0-1.0, float32 input is not copied"""
+    if img.dtype == np.float32:
+        return img
+    if np.issubdtype(img.dtype, np.integer):
+        out = np.empty(img.shape, dtype=np.float32)
+        np.multiply(img, np.float32(1.0 / np.iinfo(img.dtype).max), out=out)
+        return out
+    return img.astype(np.float32)
+
+
+def convert_pixels(img: np.ndarray, dtype, alpha: bool = True):
+    """
+    Converts an image to a storage format: float32, float16 or uint16, with
+    or without alpha channel. Nothing is copied if the image already is in
+    that format.
+    """
+    dtype = np.dtype(dtype)
+    channels = img.shape[2] if img.ndim == 3 else None
+    if channels == 4 and not alpha:
+        # A slice would still hold on to the whole RGBA buffer
+        img = img[..., :3]
+        if img.dtype == dtype:
+            return np.ascontiguousarray(img)
+    if img.dtype != dtype:
+        if np.issubdtype(dtype, np.integer):
+            max_val = np.iinfo(dtype).max
+            scaled = np.clip(to_float(img), 0.0, 1.0) * np.float32(max_val)
+            img = np.rint(scaled, out=scaled).astype(dtype)
+        else:
+            img = to_float(img).astype(dtype, copy=False)
+    if channels == 3 and alpha:
+        opaque = np.iinfo(dtype).max if np.issubdtype(dtype, np.integer) else 1.0
+        rgba = np.empty(img.shape[:2] + (4,), dtype=dtype)
+        rgba[..., :3] = img
+        rgba[..., 3] = opaque
+        img = rgba
+    return img
+
+
+def load_image(path: str):
+    """Loads an image file as RGBA float32 in the 0.0-1.0 range"""
+    img = map_image(path)
+    return to_rgba(read_image(path) if img is None else img)
+
+
+def to_rgba(img: np.ndarray, bps: int = None):
+    """
+    Normalizes an integer RGB or RGBA image to RGBA float32 in 0.0-1.0, bps
+    defaults to the size of the dtype
+    """
+    # Memory-mapped images are read here
+    img = np.asarray(img)
+    if bps is None:
+        bps = 8 * img.dtype.itemsize
+    max_val = (2 ** bps) - 1
+    h, w, c = img.shape
+    rgba = np.empty((h, w, 4), dtype=np.float32)
+    np.multiply(img[..., :3], np.float32(1.0 / max_val), out=rgba[..., :3])
+    if c == 4:
+        np.multiply(img[..., 3], np.float32(1.0 / max_val), out=rgba[..., 3])
+    else:
+        # Add alpha channel (fully opaque)
+        rgba[..., 3] = 1.0
+    return rgba
+
+
+def downsample2(img: np.ndarray):
+    """Halves an image by averaging 2x2 blocks, returns float32 in 0.0-1.0"""
+    h, w = img.shape[0] // 2, img.shape[1] // 2
+    out = np.add(img[0:2 * h:2, 0:2 * w:2], img[1:2 * h:2, 0:2 * w:2], dtype=np.float32)
+    out += img[0:2 * h:2, 1:2 * w:2]
+    out += img[1:2 * h:2, 1:2 * w:2]
+    scale = 0.25
+    if np.issubdtype(img.dtype, np.integer):
+        scale /= np.iinfo(img.dtype).max
+    out *= np.float32(scale)
+    return out
+
+
+def _downsample2_bands(img, rows: int = 512):
+    """
+    downsample2() reading the image in bands of rows, so a memory-mapped
+    image is read in order and never copied whole
+    """
+    h, w = img.shape[0] // 2, img.shape[1] // 2
+    out = np.empty((h, w) + img.shape[2:], dtype=np.float32)
+    for y in range(0, h, rows // 2):
+        y1 = min(y + rows // 2, h)
+        out[y:y1] = downsample2(np.asarray(img[2 * y:2 * y1]))
+    return out
+
+
+def build_pyramid(img: np.ndarray, min_dim: int = 256, cache: callable = None):
+    """
+    Returns the levels of an image pyramid, halving until the larger side is
+    below 2 * min_dim. Level 0 is the image itself in its own dtype, smaller
+    levels are float32. cache(level, compute) can return a level from a
+    cache, calling compute() to build it on a miss.
+    """
+    levels = [img]
+    while max(levels[-1].shape[:2]) >= 2 * min_dim:
+        prev = levels[-1]
+        # Level 0 may be memory-mapped, it is read in bands
+        reduce = _downsample2_bands if len(levels) == 1 else downsample2
+        if cache is None:
+            levels.append(reduce(prev))
+        else:
+            levels.append(cache(len(levels), lambda: reduce(prev)))
+    return levels
+
+
+def pyramid_level(levels: list, max_dim: int):
+    """Returns the smallest level with its larger side at least max_dim"""
+    for level in reversed(levels):
+        if max(level.shape[:2]) >= max_dim:
+            return level
+    return levels[0]
+
+
+def _resize_axis(img: np.ndarray, n_out: int, axis: int):
+    """Area average resampling of one axis to n_out pixels, downscaling only"""
+    n_in = img.shape[axis]
+    scale = n_in / n_out
+    start = np.arange(n_out) * scale
+    end = start + scale
+    first = np.floor(start).astype(np.intp)
+    shape = [1] * img.ndim
+    shape[axis] = n_out
+
+    out = None
+    # Every output pixel covers at most ceil(scale) + 1 input pixels
+    for tap in range(int(np.ceil(scale)) + 1):
+        idx = first + tap
+        weight = np.clip(np.minimum(end, idx + 1) - np.maximum(start, idx), 0, None)
+        weight = (weight / scale).astype(np.float32).reshape(shape)
+        part = np.take(img, np.minimum(idx, n_in - 1), axis=axis) * weight
+        out = part if out is None else np.add(out, part, out=out)
+    return out
+
+
+def area_resize(img: np.ndarray, width: int, height: int):
+    """Downscales a float image with area averaging"""
+    img = to_float(img)
+    if img.shape[0] != height:
+        img = _resize_axis(img, height, 0)
+    if img.shape[1] != width:
+        img = _resize_axis(img, width, 1)
+    return img
+
+
+def preview_from_pyramid(levels: list, max_dim: int = 500):
+    """Scales the pyramid level closest above max_dim to fit in max_dim x max_dim"""
+    img = np.asarray(pyramid_level(levels, max_dim))
+    h, w = img.shape[:2]
+    scale = min(1.0, max_dim / w, max_dim / h)
+    if scale >= 1.0:
+        return to_float(img)
+    return area_resize(img, max(1, int(w * scale)), max(1, int(h * scale)))
+
+
+def fit_image(img: np.ndarray, width: int, height: int):
+    """
+    Scales an image down to fit in width x height, halving it while it is at
+    least twice too large and area averaging the rest. Images that already
+    fit are returned as they are.
+    """
+    h, w = img.shape[:2]
+    while min(width / w, height / h) <= 0.5 and min(w, h) >= 2:
+        img = downsample2(img)
+        h, w = img.shape[:2]
+    scale = min(1.0, width / w, height / h)
+    if scale >= 1.0:
+        return img
+    return area_resize(img, max(1, round(w * scale)), max(1, round(h * scale)))
+
+
+def make_preview(img: np.ndarray, max_dim: int = 500):
+    """Scales an image down to fit in max_dim x max_dim, as float32"""
+    return preview_from_pyramid(build_pyramid(img, max_dim), max_dim)
+
+
+def save_image(img: np.ndarray, path: str, rows: int = 256):
+    """
+    Saves an image, 16 bit for TIFF and 8 bit otherwise. It is converted and
+    written in strips of rows, PIL can't write 16 bit RGB(A).
+    """
+    h, w = img.shape[:2]
+    writer = open_strip_writer(path, w, h, 1 if img.ndim == 2 else img.shape[2])
+    for y in range(0, h, rows):
+        writer.write(img[y:y + rows])
+    writer.close()
+
+
+def invert(img: np.ndarray):
+    """Inverts the color channels, works on every storage format"""
+    inverted = np.empty_like(img)
+    white = np.iinfo(img.dtype).max if np.issubdtype(img.dtype, np.integer) else 1.0
+    np.subtract(img.dtype.type(white), img[..., :3], out=inverted[..., :3])
+    inverted[..., 3:] = img[..., 3:]
+    return inverted
+
+
+def monochrome(img: np.ndarray):
+    """Luminance in every color channel, keeps the format of the input"""
+    weights = np.array([0.2126, 0.7152, 0.0722], dtype=np.float32)
+    gray = np.matmul(to_float(img[..., :3]), weights)
+    gray = convert_pixels(gray[..., np.newaxis], img.dtype, alpha=False)
+
+    out = np.empty_like(img)
+    out[..., :3] = gray
+    out[..., 3:] = img[..., 3:]
+    return out
+
+
+def compute_histograms(img: np.ndarray, bins: int = 64):
+    """Returns log scaled (x, y) histogram series for R, G, B and luminance"""
+    img = np.clip(to_float(img), 0.0, 1.0)
+
+    r, g, b = img[..., 0], img[..., 1], img[..., 2]
+    luminance = 0.2126 * r + 0.7152 * g + 0.0722 * b
+
+    hist_range = (0.0, 1.0)
+    bin_edges = np.linspace(*hist_range, bins)
+
+    def compute_hist(channel):
+        hist, _ = np.histogram(channel, bins=bin_edges)
+        x = bin_edges[:-1]
+        y = np.log1p(hist)
+        y = y / np.max(y)
+        return x.tolist(), y.tolist()
+
+    return {
+        "R": compute_hist(r),
+        "G": compute_hist(g),
+        "B": compute_hist(b),
+        "L": compute_hist(luminance),
+    }
+
+
+def to_texture_data(img: np.ndarray, out: np.ndarray = None):
+    """
+    Converts an image to the flat RGBA float32 data of a dearpygui texture.
+    The data is written to out when it has the right size, so a texture
+    buffer can be reused between updates.
+    """
+    h, w, c = img.shape
+    if out is None or out.size != h * w * 4:
+        out = np.empty(h * w * 4, dtype=np.float32)
+    rgba = out.reshape(h, w, 4)
+    c = min(c, 4)
+    if np.issubdtype(img.dtype, np.integer):
+        scale = np.float32(1.0 / np.iinfo(img.dtype).max)
+        np.multiply(img[..., :c], scale, out=rgba[..., :c])
+    else:
+        np.copyto(rgba[..., :c], img[..., :c])
+    if c == 3:
+        rgba[..., 3] = 1.0
+    return out
+
+
+def rot90_k(rotation: int):
+    # np.rot90 rotates counterclockwise, our rotation is clockwise
+    return {90: 3, 180: 2, 270: 1}.get(rotation, 0)
+
+
+def orient(img: np.ndarray, rotation: int, mirror_h: bool, mirror_v: bool):
+    """Rotates clockwise and mirrors, only creates views, nothing is copied"""
+    img_out = np.rot90(img, k=rot90_k(rotation)) if rotation else img
+
+    # Apply mirroring
+    if mirror_h:
+        img_out = np.fliplr(img_out)
+    if mirror_v:
+        img_out = np.flipud(img_out)
+
+    return img_out
+
+
+def crop_rect(start: tuple, end: tuple, ref_shape: tuple, shape: tuple):
+    """
+    Scales the crop rectangle between the corners start and end (x, y) of an
+    image of ref_shape to an image of shape, returns (x0, y0, x1, y1)
+    """
+    sx = shape[1] / ref_shape[1]
+    sy = shape[0] / ref_shape[0]
+    x0, y0 = start
+    x1, y1 = end
+    x0, x1 = sorted((int(x0 * sx), int(x1 * sx)))
+    y0, y1 = sorted((int(y0 * sy), int(y1 * sy)))
+
+    x0 = max(0, min(x0, shape[1]-1))
+    x1 = max(0, min(x1, shape[1]-1))
+    y0 = max(0, min(y0, shape[0]-1))
+    y1 = max(0, min(y1, shape[0]-1))
+    return (x0, y0, x1, y1)
+
+
+def rotate_and_crop(
+    img: np.ndarray,
+    angle: float,
+    rect: tuple[int, int, int, int],
+    cval: float = 0.0
+) -> np.ndarray:
+    from scipy.ndimage import rotate
+
+    h, w = img.shape[:2]
+    x, y, cw, ch = rect
+    if img.dtype == np.float16:
+        # scipy.ndimage has no float16 support
+        img = to_float(img)
+    rotated = np.empty_like(img)
+    for c in range(img.shape[2]):
+        rotate(
+            img[..., c],
+            angle,
+            reshape=False,
+            output=rotated[..., c],
+            order=1,              # bilinear interpolation
+            mode='constant',
+            cval=cval,
+            prefilter=False
+        )
+    x0 = max(0, min(int(x), w - 1))
+    y0 = max(0, min(int(y), h - 1))
+    x1 = max(0, min(int(x + cw), w))
+    y1 = max(0, min(int(y + ch), h))
+    return rotated[y0:y1, x0:x1]
@@ -0,0 +1,225 @@
+import ast
+import io
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import rawpy
+
+from .disk_cache import DiskCache, file_key, get_disk_cache
+from .processing import build_pyramid, to_rgba
+from .stage_cache import StageCache
+
+
+def default_raw_config():
+    return {
+        # Demosaic algorithm
+        "demosaic_algorithm": rawpy.DemosaicAlgorithm.AHD,
+        # Output color space
+        "output_color":       rawpy.ColorSpace.sRGB,
+        # Bits per sample
+        "output_bps":         16,
+        # White balance
+        "use_camera_wb":      True,
+        "use_auto_wb":        False,
+        "user_wb":            (1.0, 1.0, 1.0, 1.0),
+        # Brightness/exposure
+        "bright":             1.0,
+        "no_auto_bright":     False,
+        # Gamma correction (you’ll pass (1.0, config["gamma"]) down)
+        "gamma":              1.0,
+        # Size & quality toggles
+        "half_size":          False,
+        "four_color_rgb":     False,
+    }
+
+
+def serialize_raw_config(rawconfig: dict):
+    return {k: str(v) for k, v in rawconfig.items()}
+
+
+def parse_raw_config(raw_cfg: dict):
+    """Parses a serialized raw config back into Python types"""
+    rawconfig = {}
+    for k, v in raw_cfg.items():
+        if k == "demosaic_algorithm":
+            # "DemosaicAlgorithm.AHD" → "AHD"
+            name = v.split(".", 1)[1]
+            rawconfig[k] = rawpy.DemosaicAlgorithm[name]
+        elif k == "output_color":
+            name = v.split(".", 1)[1]
+            rawconfig[k] = rawpy.ColorSpace[name]
+        elif k == "output_bps":
+            rawconfig[k] = int(v)
+        elif k in ("use_camera_wb","use_auto_wb",
+                   "no_auto_bright","half_size","four_color_rgb"):
+            rawconfig[k] = (v == "True")
+        elif k in ("bright","gamma"):
+            rawconfig[k] = float(v)
+        elif k == "user_wb":
+            rawconfig[k] = tuple(ast.literal_eval(v))
+    return rawconfig
+
+
+def postprocess_args(rawconfig: dict):
+    """Prepare postprocess kwargs from config"""
+    args = {
+        'demosaic_algorithm': rawconfig["demosaic_algorithm"],
+        'output_color':       rawconfig["output_color"],
+        'output_bps':         rawconfig["output_bps"],
+        'bright':             rawconfig["bright"],
+        'no_auto_bright':     rawconfig["no_auto_bright"],
+        'gamma':              (1.0, rawconfig["gamma"]),
+        'half_size':          rawconfig["half_size"],
+        'four_color_rgb':     rawconfig["four_color_rgb"],
+    }
+
+    if rawconfig["use_camera_wb"]:
+        args['use_camera_wb'] = True
+    elif rawconfig["use_auto_wb"]:
+        args['use_auto_wb'] = True
+    else:
+        args['user_wb'] = rawconfig["user_wb"]
+    return args
+
+
+def thumbnail_rgba(raw):
+    """
+    Returns the embedded thumbnail as RGBA float32, rotated like the
+    postprocessed image, or None if the file has no usable thumbnail
+    """
+    try:
+        thumb = raw.extract_thumb()
+    except (rawpy.LibRawNoThumbnailError, rawpy.LibRawUnsupportedThumbnailError):
+        return None
+    if thumb.format == rawpy.ThumbFormat.JPEG:
+        from PIL import Image
+
+        rgb = np.asarray(Image.open(io.BytesIO(thumb.data)).convert("RGB"))
+    else:
+        rgb = thumb.data
+    # LibRaw flip codes, postprocess() applies these but thumbnails are raw
+    k = {3: 2, 5: 1, 6: 3}.get(raw.sizes.flip, 0)
+    return to_rgba(np.rot90(rgb, k=k), 8)
+
+
+def decode_raw(path: str, rawconfig: dict):
+    """Demosaics a RAW file into an RGBA float32 image"""
+    with rawpy.imread(path) as raw:
+        # Postprocess into RGB
+        rgb = raw.postprocess(**postprocess_args(rawconfig))
+    return to_rgba(rgb, rawconfig["output_bps"])
+
+
+def postprocess_key(rawconfig: dict):
+    """Hashable key of the settings that influence the postprocessed image"""
+    return tuple(sorted(postprocess_args(rawconfig).items()))
+
+
+class RawDecodeCache:
+    """
+    Caches opened RAW files and their postprocessed images. Opened files keep
+    the unpacked sensor data, so changing a postprocessing setting skips
+    reading and unpacking the file again. Postprocessed images are kept per
+    file and settings, switching back to earlier settings needs no decoding
+    at all. With a disk cache decoded images also survive restarts.
+    """
+
+    def __init__(
+        self,
+        max_files: int = 2,
+        image_budget: int = 2 * 1024**3,
+        disk: DiskCache = None,
+    ):
+        self.max_files = max_files
+        self.raw_files = OrderedDict()
+        self.images = StageCache(image_budget)
+        self.disk = disk
+        # LibRaw handles are not thread safe
+        self.lock = threading.Lock()
+
+    def _open(self, key):
+        raw = self.raw_files.get(key)
+        if raw is not None:
+            self.raw_files.move_to_end(key)
+            return raw
+        raw = rawpy.imread(key[0])
+        self.raw_files[key] = raw
+        while len(self.raw_files) > self.max_files:
+            _, old = self.raw_files.popitem(last=False)
+            old.close()
+        return raw
+
+    def decode(self, path: str, rawconfig: dict):
+        """Returns the read-only RGBA float32 image like decode_raw()"""
+        fkey = file_key(path)
+        key = (fkey, postprocess_key(rawconfig))
+        img = self.images.get(key)
+        if img is not None:
+            return img
+        img = to_rgba(self.decode_mapped(path, rawconfig))
+        img.flags.writeable = False
+        self.images.put(key, img)
+        return img
+
+    def decode_mapped(self, path: str, rawconfig: dict):
+        """
+        Returns the postprocessed integer RGB image. With a disk cache it is
+        memory-mapped from there, so regions can be read without loading the
+        whole image.
+        """
+        dkey = self.disk.key(path, postprocess_key(rawconfig)) if self.disk else None
+        if dkey is not None:
+            rgb = self.disk.get(dkey)
+            if rgb is not None:
+                return rgb
+        with self.lock:
+            if dkey is not None:
+                # Another thread may have decoded it while we waited
+                rgb = self.disk.get(dkey)
+                if rgb is not None:
+                    return rgb
+            raw = self._open(file_key(path))
+            rgb = raw.postprocess(**postprocess_args(rawconfig))
+            if dkey is not None:
+                rgb = self.disk.put(dkey, rgb)
+        return rgb
+
+    def decode_pyramid(self, path: str, rawconfig: dict, use_thumbnail: bool = False):
+        """
+        Returns a preview image pyramid, see build_pyramid(). It is built from
+        a half-size decode, which skips demosaicing and is kept in the disk
+        cache, or from the embedded thumbnail if use_thumbnail is set. The
+        thumbnail ignores the postprocessing settings but needs no decoding.
+        """
+        img = None
+        if use_thumbnail:
+            with self.lock:
+                img = thumbnail_rgba(self._open(file_key(path)))
+        if img is None:
+            half = dict(rawconfig, half_size=True)
+            img = self.decode_mapped(path, half)
+        return build_pyramid(img)
+
+    def clear(self):
+        with self.lock:
+            for raw in self.raw_files.values():
+                raw.close()
+            self.raw_files.clear()
+        self.images.clear()
+
+    def get_stats(self):
+        stats = self.images.get_stats()
+        stats["open_files"] = len(self.raw_files)
+        return stats
+
+
+_decode_cache = None
+
+
+def get_decode_cache():
+    """The decode cache shared by all RAW sources of this process"""
+    global _decode_cache
+    if _decode_cache is None:
+        _decode_cache = RawDecodeCache(disk=get_disk_cache())
+    return _decode_cache
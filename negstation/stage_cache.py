@@ -0,0 +1,95 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class StageCache:
+    """
+    LRU cache for stage output images with a byte budget. The most recently
+    stored image is never evicted, so a single image larger than the budget
+    is still kept until something else is stored. sizeof returns the bytes
+    an entry takes. By default entries are arrays, views and slices sharing
+    a buffer count its size once.
+    """
+
+    def __init__(self, budget: int, sizeof: callable = None):
+        self.budget = budget
+        self.sizeof = sizeof
+        self.entries = OrderedDict()
+        self.bytes_held = 0
+        # Buffer id -> [buffer, number of entries using it]
+        self._buffers = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, img: np.ndarray):
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = img
+            self._acquire(img)
+            while self.bytes_held > self.budget and len(self.entries) > 1:
+                old_key = next(iter(self.entries))
+                self._remove(old_key)
+                self.evictions += 1
+
+    def discard(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self._buffers.clear()
+            self.bytes_held = 0
+
+    def set_budget(self, budget: int):
+        self.budget = budget
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes_held": self.bytes_held,
+                "budget": self.budget,
+            }
+
+    def _buffer(self, img):
+        """Returns the object whose memory an entry uses and its size"""
+        if self.sizeof is not None:
+            return img, self.sizeof(img)
+        while isinstance(img.base, np.ndarray):
+            img = img.base
+        return img, img.nbytes
+
+    def _acquire(self, img):
+        buffer, size = self._buffer(img)
+        entry = self._buffers.setdefault(id(buffer), [buffer, 0])
+        if entry[1] == 0:
+            self.bytes_held += size
+        entry[1] += 1
+
+    def _remove(self, key):
+        img = self.entries.pop(key, None)
+        if img is None:
+            return
+        buffer, size = self._buffer(img)
+        entry = self._buffers[id(buffer)]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._buffers[id(buffer)]
+            self.bytes_held -= size
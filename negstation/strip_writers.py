@@ -0,0 +1,170 @@
+import os
+import struct
+import zlib
+
+import numpy as np
+
+
+def to_output_dtype(img: np.ndarray, ext: str):
+    """Converts an image to 16 bit for TIFF and 8 bit otherwise"""
+    dtype = np.uint16 if ext in (".tif", ".tiff") else np.uint8
+    if img.dtype == dtype:
+        return img
+    if np.issubdtype(img.dtype, np.integer):
+        img = img.astype(np.float32) / np.iinfo(img.dtype).max
+    max_val = np.iinfo(dtype).max
+    return np.clip(img * float(max_val), 0, max_val).astype(dtype)
+
+
+class StripWriter:
+    """
+    Writes an image of known size as a sequence of horizontal strips from
+    top to bottom, so the whole image never has to be held in memory.
+    """
+
+    def __init__(self, path: str, width: int, height: int, channels: int):
+        self.path = path
+        self.ext = os.path.splitext(path)[-1].lower()
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.rows_written = 0
+
+    def write(self, strip: np.ndarray):
+        strip = to_output_dtype(strip, self.ext)
+        if strip.ndim == 2:
+            strip = strip[..., np.newaxis]
+        self.write_strip(np.ascontiguousarray(strip))
+        self.rows_written += strip.shape[0]
+
+    def write_strip(self, strip: np.ndarray):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PNGStripWriter(StripWriter):
+    """8 bit PNG, strips are streamed through one zlib stream into IDAT chunks"""
+
+    COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+
+    def __init__(self, path, width, height, channels):
+        super().__init__(path, width, height, channels)
+        self.file = open(path, "wb")
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(
+            ">IIBBBBB", width, height, 8, self.COLOR_TYPES[channels], 0, 0, 0
+        ))
+        self.compressor = zlib.compressobj(6)
+
+    def _chunk(self, kind: bytes, data: bytes):
+        self.file.write(struct.pack(">I", len(data)))
+        self.file.write(kind + data)
+        self.file.write(struct.pack(">I", zlib.crc32(kind + data)))
+
+    def write_strip(self, strip):
+        h = strip.shape[0]
+        # Every row starts with filter type 0 (none)
+        rows = np.zeros((h, 1 + self.width * self.channels), dtype=np.uint8)
+        rows[:, 1:] = strip.reshape(h, -1)
+        data = self.compressor.compress(rows.tobytes())
+        if data:
+            self._chunk(b"IDAT", data)
+
+    def close(self):
+        self._chunk(b"IDAT", self.compressor.flush())
+        self._chunk(b"IEND", b"")
+        self.file.close()
+
+
+class TIFFStripWriter(StripWriter):
+    """Uncompressed 16 bit baseline TIFF, the IFD is written after the strips"""
+
+    def __init__(self, path, width, height, channels):
+        super().__init__(path, width, height, channels)
+        self.file = open(path, "wb")
+        # Header, the IFD offset is patched in close()
+        self.file.write(b"II*\x00\x00\x00\x00\x00")
+        self.strip_offsets = []
+        self.strip_byte_counts = []
+        self.rows_per_strip = None
+
+    def write_strip(self, strip):
+        if self.rows_per_strip is None:
+            self.rows_per_strip = strip.shape[0]
+        data = strip.astype("<u2").tobytes()
+        self.strip_offsets.append(self.file.tell())
+        self.strip_byte_counts.append(len(data))
+        self.file.write(data)
+
+    def close(self):
+        c = self.channels
+        entries = [
+            (256, 4, [self.width]),                  # ImageWidth
+            (257, 4, [self.height]),                 # ImageLength
+            (258, 3, [16] * c),                      # BitsPerSample
+            (259, 3, [1]),                           # Compression: none
+            (262, 3, [2 if c >= 3 else 1]),          # Photometric: RGB/gray
+            (273, 4, self.strip_offsets),            # StripOffsets
+            (277, 3, [c]),                           # SamplesPerPixel
+            (278, 4, [self.rows_per_strip or self.height]),  # RowsPerStrip
+            (279, 4, self.strip_byte_counts),        # StripByteCounts
+            (284, 3, [1]),                           # PlanarConfiguration
+        ]
+        if c in (2, 4):
+            entries.append((338, 3, [2]))            # ExtraSamples: alpha
+
+        if self.file.tell() % 2:
+            self.file.write(b"\x00")
+        ifd_offset = self.file.tell()
+        extra_offset = ifd_offset + 2 + 12 * len(entries) + 4
+        ifd = struct.pack("<H", len(entries))
+        extra = b""
+        for tag, kind, values in entries:
+            fmt = "<%d%s" % (len(values), "H" if kind == 3 else "I")
+            data = struct.pack(fmt, *values)
+            if len(data) <= 4:
+                value = data.ljust(4, b"\x00")
+            else:
+                value = struct.pack("<I", extra_offset + len(extra))
+                extra += data
+            ifd += struct.pack("<HHI", tag, kind, len(values)) + value
+        ifd += struct.pack("<I", 0)
+        self.file.write(ifd + extra)
+        self.file.seek(4)
+        self.file.write(struct.pack("<I", ifd_offset))
+        self.file.close()
+
+
+class PILStripWriter(StripWriter):
+    """
+    Fallback for formats that can't be written incrementally, the strips are
+    collected in an 8 bit buffer and saved via Pillow at the end.
+    """
+
+    def __init__(self, path, width, height, channels):
+        super().__init__(path, width, height, channels)
+        self.buffer = np.empty((height, width, channels), dtype=np.uint8)
+
+    def write_strip(self, strip):
+        self.buffer[self.rows_written:self.rows_written + strip.shape[0]] = strip
+
+    def close(self):
+        from PIL import Image
+
+        arr = self.buffer[..., 0] if self.channels == 1 else self.buffer
+        im = Image.fromarray(arr)
+        # JPEG doesn’t support alpha — drop it
+        if self.ext in (".jpg", ".jpeg") and im.mode == "RGBA":
+            im = im.convert("RGB")
+        im.save(self.path)
+
+
+def open_strip_writer(path: str, width: int, height: int, channels: int):
+    ext = os.path.splitext(path)[-1].lower()
+    if ext == ".png":
+        return PNGStripWriter(path, width, height, channels)
+    if ext in (".tif", ".tiff"):
+        return TIFFStripWriter(path, width, height, channels)
+    return PILStripWriter(path, width, height, channels)
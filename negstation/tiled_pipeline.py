@@ -0,0 +1,116 @@
+import logging
+import time
+
+from .image_pipeline import ImagePipeline
+
+
+class TiledPipeline:
+    """
+    Runs the full-res chain feeding a sink stage strip by strip instead of
+    publishing whole images, so peak memory is bounded by the strip size.
+
+    For every output strip the rectangle each stage needs from its input is
+    derived backwards through the chain (get_tile_input_rect, which adds a
+    halo for neighbourhood operations), the source tile is read and then
+    pushed forwards through every stage's process_tile. Rectangles are
+    (x0, y0, x1, y1) with exclusive end, shapes are image array shapes.
+    """
+
+    def __init__(
+        self,
+        pipeline: ImagePipeline,
+        logger: logging.Logger,
+        strip_bytes: int = 64 * 1024**2,
+    ):
+        self.pipeline = pipeline
+        self.logger = logger
+        self.strip_bytes = strip_bytes
+
+    def build_chain(self, stage_id: int):
+        """Returns the processors producing stage_id, source first, or None"""
+        chain = []
+        sid = stage_id
+        while sid is not None:
+            processor = self.pipeline.get_processor(sid)
+            if processor is None:
+                self.logger.error(f"Stage {sid} has no processor")
+                return None
+            if not processor.supports_tiles:
+                self.logger.error(
+                    f"Stage '{self.pipeline.get_stage_name(sid)}' can't run tiled")
+                return None
+            chain.append(processor)
+            sid = self.pipeline.get_stage_input(sid)
+        chain.reverse()
+        if chain[0].has_pipeline_in:
+            self.logger.error(f"Stage {stage_id} is not connected to a source")
+            return None
+        return chain
+
+    def get_shapes(self, chain: list):
+        """
+        Returns the full-res image shape after every processor of a chain,
+        or None if the source has no full-res image
+        """
+        shape = chain[0].get_full_res_shape()
+        if shape is None:
+            return None
+        shapes = [tuple(shape)]
+        for stage in chain[1:]:
+            shapes.append(tuple(stage.get_tile_output_shape(shapes[-1])))
+        return shapes
+
+    def compute_rect(self, chain: list, shapes: list, rect: tuple):
+        """Computes the rectangle rect of the chain's full-res output"""
+        source, stages = chain[0], chain[1:]
+        rects = [rect]
+        for stage, in_shape in zip(reversed(stages), reversed(shapes[:-1])):
+            rects.append(self._clip(stage.get_tile_input_rect(rects[-1], in_shape), in_shape))
+        rects.reverse()
+
+        tile = source.read_full_res_tile(rects[0])
+        for i, stage in enumerate(stages):
+            tile = stage.process_tile(tile, rects[i], rects[i + 1], shapes[i])
+        return tile
+
+    def run(self, stage_id: int, open_writer: callable):
+        """
+        Computes stage stage_id in strips, open_writer(width, height,
+        channels) must return a StripWriter receiving them top to bottom.
+        Returns False if the chain can't run tiled.
+        """
+        chain = self.build_chain(stage_id)
+        if chain is None:
+            return False
+        shapes = self.get_shapes(chain)
+        if shapes is None:
+            self.logger.error("Source stage has no full-res image")
+            return False
+
+        h, w = shapes[-1][:2]
+        c = shapes[-1][2] if len(shapes[-1]) > 2 else 1
+        rows = max(1, self.strip_bytes // (w * c * 4))
+        self.logger.info(
+            f"Running tiled full-res pipeline: {w}x{h} in strips of {rows} rows")
+
+        start = time.perf_counter()
+        writer = open_writer(w, h, c)
+        try:
+            for y in range(0, h, rows):
+                writer.write(self.compute_rect(chain, shapes, (0, y, w, min(h, y + rows))))
+        finally:
+            writer.close()
+        self.logger.info(
+            f"Tiled full-res pipeline done in {time.perf_counter() - start:.2f}s")
+        return True
+
+    @staticmethod
+    def _clip(rect: tuple, shape: tuple):
+        x0, y0, x1, y1 = rect
+        h, w = shape[:2]
+        return (
+            max(0, min(int(x0), w)),
+            max(0, min(int(y0), h)),
+            max(0, min(int(x1), w)),
+            max(0, min(int(y1), h)),
+        )
@@ -0,0 +1,136 @@
+import logging
+import threading
+
+import numpy as np
+
+from .stage_cache import StageCache
+from .tiled_pipeline import TiledPipeline
+
+
+class ViewTiles:
+    """
+    Full-res tiles of pipeline stages for zoomed-in viewers. Only the tiles
+    in view are computed, on the worker pool by running the tiled chain for
+    their rectangle, and kept in an LRU cache so panning back is free. Tiles
+    are keyed by the stage version, a new preview of the stage invalidates
+    them.
+    """
+
+    def __init__(
+        self,
+        manager,
+        logger: logging.Logger,
+        tile_size: int = 512,
+        budget: int = 256 * 1024**2,
+    ):
+        self.manager = manager
+        self.logger = logger
+        self.tiled = TiledPipeline(manager.pipeline, logger)
+        self.tile_size = tile_size
+        self.cache = StageCache(budget)
+        self.lock = threading.Lock()
+        # Keys of tiles being computed
+        self.pending = set()
+        # (stage id, version) -> (chain, shapes), None if it can't run tiled.
+        # Updated on the workers, guarded by lock.
+        self._chains = {}
+
+    def full_shape(self, stage_id: int, version, on_ready: callable):
+        """
+        Returns the full-res shape of a stage, or None while it is looked up
+        or if the stage can't be computed in tiles
+        """
+        key = (stage_id, version)
+        with self.lock:
+            known = key in self._chains
+            chain = self._chains.get(key)
+        if known:
+            return None if chain is None else chain[1][-1]
+        self._request(("chain",) + key, [], on_ready)
+        return None
+
+    def get_region(self, stage_id: int, version, rect: tuple, on_ready: callable):
+        """
+        Returns the full-res region rect (x0, y0, x1, y1) of a stage. While
+        some of its tiles are missing they are computed in the background,
+        None is returned and on_ready() is called once they are done.
+        """
+        x0, y0, x1, y1 = rect
+        ts = self.tile_size
+        tiles = {}
+        missing = []
+        for ty in range(y0 // ts, -(-y1 // ts)):
+            for tx in range(x0 // ts, -(-x1 // ts)):
+                key = (stage_id, version, tx, ty)
+                tile = self.cache.get(key)
+                if tile is None:
+                    missing.append(key)
+                else:
+                    tiles[tx, ty] = tile
+        if missing:
+            self._request(("tiles", stage_id, version), missing, on_ready)
+            return None
+
+        first = next(iter(tiles.values()))
+        out = np.empty((y1 - y0, x1 - x0) + first.shape[2:], dtype=first.dtype)
+        for (tx, ty), tile in tiles.items():
+            cx, cy = tx * ts, ty * ts
+            sx0, sy0 = max(x0, cx), max(y0, cy)
+            sx1, sy1 = min(x1, cx + tile.shape[1]), min(y1, cy + tile.shape[0])
+            out[sy0 - y0:sy1 - y0, sx0 - x0:sx1 - x0] = tile[sy0 - cy:sy1 - cy, sx0 - cx:sx1 - cx]
+        return out
+
+    def clear(self):
+        self.cache.clear()
+        with self.lock:
+            self._chains.clear()
+
+    def _request(self, job_key, keys: list, on_ready: callable):
+        with self.lock:
+            keys = [k for k in keys if k not in self.pending]
+            if job_key[0] == "chain":
+                if job_key in self.pending:
+                    return
+                self.pending.add(job_key)
+            elif not keys:
+                return
+            self.pending.update(keys)
+        self.manager.bus.run_in_worker(self._compute, (job_key, keys, on_ready))
+
+    def _get_chain(self, stage_id: int, version):
+        key = (stage_id, version)
+        with self.lock:
+            if key in self._chains:
+                return self._chains[key]
+        chain = self.tiled.build_chain(stage_id)
+        shapes = None if chain is None else self.tiled.get_shapes(chain)
+        chain = None if shapes is None else (chain, shapes)
+        with self.lock:
+            # Only the newest version of a stage is worth keeping
+            for k in [k for k in self._chains if k[0] == stage_id]:
+                del self._chains[k]
+            self._chains[key] = chain
+        return chain
+
+    def _compute(self, data):
+        job_key, keys, on_ready = data
+        try:
+            chain = self._get_chain(*job_key[1:])
+            if chain is not None:
+                chain, shapes = chain
+                h, w = shapes[-1][:2]
+                ts = self.tile_size
+                for key in keys:
+                    tx, ty = key[2:]
+                    rect = (tx * ts, ty * ts, min(w, (tx + 1) * ts), min(h, (ty + 1) * ts))
+                    self.cache.put(key, self.tiled.compute_rect(chain, shapes, rect))
+        except Exception as e:
+            self.logger.error(f"Failed to compute view tiles: {e}")
+            # Don't retry on every redraw, the viewer falls back to the preview
+            with self.lock:
+                self._chains[job_key[1:]] = None
+        finally:
+            with self.lock:
+                self.pending.difference_update(keys)
+                self.pending.discard(job_key)
+        on_ready()
@@ -0,0 +1,63 @@
+import ast
+import importlib
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class WidgetSpec:
+    """
+    A registered widget class that is only imported when it is first
+    instantiated, so heavy dependencies of widgets don't slow down startup
+    """
+
+    def __init__(self, class_name: str, name: str, module_name: str):
+        self.class_name = class_name
+        self.name = name
+        self.module_name = module_name
+        self._cls = None
+
+    def load(self):
+        if self._cls is None:
+            module = importlib.import_module(self.module_name)
+            self._cls = getattr(module, self.class_name)
+        return self._cls
+
+
+def _class_constant(node: ast.ClassDef, attribute: str):
+    """Returns the literal value a class body assigns to attribute, or None"""
+    for stmt in node.body:
+        if isinstance(stmt, ast.Assign):
+            targets, value = stmt.targets, stmt.value
+        elif isinstance(stmt, ast.AnnAssign) and stmt.value is not None:
+            targets, value = [stmt.target], stmt.value
+        else:
+            continue
+        for target in targets:
+            if isinstance(target, ast.Name) and target.id == attribute:
+                if isinstance(value, ast.Constant):
+                    return value.value
+    return None
+
+
+def scan_widgets(dir_path: Path, pkg_name: str):
+    """
+    Finds the widget classes of a package without importing it. Classes
+    assigning register = True in their own body are registered, with the
+    display name from their name attribute.
+    """
+    specs = []
+    for py_file in sorted(dir_path.glob("*.py")):
+        if py_file.name.startswith("__"):
+            continue
+        try:
+            tree = ast.parse(py_file.read_text(), filename=str(py_file))
+        except (OSError, SyntaxError) as e:
+            logger.error(f"Failed to scan widget '{py_file.name}': {e}")
+            continue
+        for node in tree.body:
+            if isinstance(node, ast.ClassDef) and _class_constant(node, "register") is True:
+                name = _class_constant(node, "name") or node.name
+                specs.append(WidgetSpec(node.name, name, f"{pkg_name}.{py_file.stem}"))
+    return specs
@@ -51,9 +51,25 @@ class BaseWidget:
         raise NotImplementedError
 
     def update(self):
-        """Must be implemented by the widget, is called in the render loop every frame"""
+        """Must be implemented by the widget, is called in the render loop when has_update()"""
         pass
 
+    def has_update(self):
+        """
+        Whether update() has work to do this frame, update() is skipped
+        otherwise. Widgets implementing update() should override this too,
+        by default they are updated every frame.
+        """
+        return type(self).update is not BaseWidget.update
+
+    def refresh_due(self):
+        """
+        Whether a timed refresh of update() is due, e.g. of statistics. Unlike
+        has_update() it doesn't count as activity, so the render loop still
+        drops to its idle frame rate.
+        """
+        return False
+
     def on_resize(self, width: int, height: int):
         """Must be implemented by the widget, is called after a resize"""
         pass
@@ -0,0 +1,71 @@
+import dearpygui.dearpygui as dpg
+import time
+from .base_widget import BaseWidget
+
+
+class BusStatsWidget(BaseWidget):
+    name = "Event Bus Stats"
+    register = True
+
+    STATS_PATH = "negstation_bus_stats.json"
+
+    def __init__(self, manager, logger):
+        super().__init__(manager, logger, window_width=420, window_height=400)
+        self.text_tag = dpg.generate_uuid()
+        self._last_refresh = 0.0
+        self._refresh_interval = 0.5  # seconds
+
+    def create_content(self):
+        with dpg.group(horizontal=True):
+            dpg.add_button(
+                label="Dump to file",
+                callback=lambda: self.manager.bus.dump_stats(self.STATS_PATH),
+            )
+            dpg.add_button(label="Reset", callback=self.manager.bus.reset_stats)
+        dpg.add_separator()
+        with dpg.child_window(autosize_x=True, autosize_y=True, horizontal_scrollbar=True):
+            dpg.add_text("", tag=self.text_tag)
+
+    def has_update(self):
+        return False
+
+    def refresh_due(self):
+        return time.time() - self._last_refresh >= self._refresh_interval
+
+    def update(self):
+        now = time.time()
+        if now - self._last_refresh < self._refresh_interval:
+            return
+        self._last_refresh = now
+        dpg.set_value(self.text_tag, self._format(self.manager.bus.get_stats()))
+
+    def _format(self, stats: dict):
+        lines = [
+            f"event queue: {stats['event_queue_depth']}   "
+            f"main queue: {stats['main_queue_depth']}   "
+            f"worker jobs: {stats['worker_jobs_pending']}",
+            "",
+        ]
+        sections = (
+            ("dispatch_latency", "Publish -> dispatch (ms)"),
+            ("worker_latency", "Publish -> worker start (ms)"),
+            ("main_latency", "Publish -> main thread start (ms)"),
+            ("handler_time", "Handler time (ms)"),
+        )
+        for category, title in sections:
+            timings = stats.get(category, {})
+            if not timings:
+                continue
+            lines.append(title)
+            # Most expensive first
+            for name, t in sorted(timings.items(), key=lambda kv: -kv[1]["total"]):
+                lines.append(
+                    f"  {name:<40} n={t['count']:<6} avg={t['avg'] * 1000:8.2f} "
+                    f"max={t['max'] * 1000:8.2f}"
+                )
+            lines.append("")
+        if stats["dropped_events"]:
+            lines.append("Coalesced (dropped) events")
+            for name, count in sorted(stats["dropped_events"].items()):
+                lines.append(f"  {name:<40} {count}")
+        return "\n".join(lines)
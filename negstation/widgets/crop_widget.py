@@ -1,5 +1,9 @@
 import dearpygui.dearpygui as dpg
 import numpy as np
+import time
+
+from negstation.processing import crop_rect
+
 from .stage_viewer_widget import PipelineStageViewer
 
 
@@ -8,15 +12,23 @@ class CropWidget(PipelineStageViewer):
     register = True
     has_pipeline_in = True
     has_pipeline_out = True
+    supports_tiles = True
 
     def __init__(self, manager, logger):
         super().__init__(manager, logger)
         self.crop_start = None  # (x, y)
         self.crop_end = None    # (x, y)
+        # (h, w) of the image the crop was drawn on
+        self.crop_shape = None
         self.crop_active = False
 
+        # Throttle recomputing while dragging
+        self._last_pub_time = 0.0
+        self._publish_interval = 0.5  # seconds
+
         self.manager.bus.subscribe("img_clicked", self.on_click)
         self.manager.bus.subscribe("img_dragged", self.on_drag)
+        self.manager.bus.subscribe("mouse_released", self.on_release)
 
     def create_pipeline_stage_content(self):
         super().create_pipeline_stage_content()
@@ -27,48 +39,106 @@ class CropWidget(PipelineStageViewer):
     def on_pipeline_data(self, img):
         if img is None:
             return
+        # A recompute feeds the same input again, its texture is still valid
+        if img is not self.img:
+            self.needs_update = True
         self.img = img
 
-        if self.crop_start and self.crop_end:
-            x0, y0 = self.crop_start
-            x1, y1 = self.crop_end
-            x0, x1 = sorted((int(x0), int(x1)))
-            y0, y1 = sorted((int(y0), int(y1)))
-
-            x0 = max(0, min(x0, img.shape[1]-1))
-            x1 = max(0, min(x1, img.shape[1]-1))
-            y0 = max(0, min(y0, img.shape[0]-1))
-            y1 = max(0, min(y1, img.shape[0]-1))
-
+        rect = self._crop_rect(img.shape)
+        if rect:
+            x0, y0, x1, y1 = rect
             cropped = img[y0:y1, x0:x1, :]
             self.publish_stage(cropped)
         else:
             self.publish_stage(img)
 
-        self.needs_update = True
+    def on_full_res_pipeline_data(self, img):
+        if img is None:
+            return
+        rect = self._crop_rect(img.shape)
+        if rect:
+            x0, y0, x1, y1 = rect
+            img = img[y0:y1, x0:x1, :]
+        self.publish_stage(img)
+
+    def _crop_rect(self, shape):
+        """Crop rectangle scaled from the previewed image to an image of shape"""
+        if not (self.crop_start and self.crop_end and self.crop_shape):
+            return None
+        return crop_rect(self.crop_start, self.crop_end, self.crop_shape, shape)
+
+    def get_tile_output_shape(self, in_shape):
+        rect = self._crop_rect(in_shape)
+        if not rect:
+            return in_shape
+        x0, y0, x1, y1 = rect
+        return (y1 - y0, x1 - x0) + tuple(in_shape[2:])
+
+    def get_tile_input_rect(self, rect, in_shape):
+        crop = self._crop_rect(in_shape)
+        if not crop:
+            return rect
+        x0, y0, x1, y1 = rect
+        return (x0 + crop[0], y0 + crop[1], x1 + crop[0], y1 + crop[1])
+
+    def process_tile(self, tile, in_rect, out_rect, in_shape):
+        return tile
+
+    def get_stage_params(self):
+        return (self.crop_start, self.crop_end, self.crop_shape)
+
+    def get_config(self):
+        config = super().get_config()
+        config["crop"] = {
+            "start": self.crop_start,
+            "end": self.crop_end,
+            "shape": self.crop_shape,
+        }
+        return config
+
+    def set_config(self, config):
+        super().set_config(config)
+        crop_cfg = config.get("crop", {})
+        # Saved as JSON lists
+        for attr in ("start", "end", "shape"):
+            value = crop_cfg.get(attr)
+            setattr(self, f"crop_{attr}", tuple(value) if value else None)
 
     def on_click(self, data):
-        if data["obj"] is not self:
+        if data["obj"] is not self or self.img is None:
             return
         if data["button"] == "left":
             self.crop_start = data["pos"]
             self.crop_end = data["pos"]
+            self.crop_shape = self.img.shape[:2]
             self.crop_active = True
-            self.needs_update = True
+            self.needs_overlay = True
 
     def on_drag(self, data):
-        if data["obj"] is not self or not self.crop_active:
+        # Middle button drags pan the view
+        if data["obj"] is not self or not self.crop_active or data["button"] == "middle":
             return
         self.crop_end = data["pos"]
-        self.needs_update = True
+        self.needs_overlay = True
+        # Throttle publishes
+        now = time.time()
+        if now - self._last_pub_time >= self._publish_interval:
+            self.request_recompute()
+            self._last_pub_time = now
+
+    def on_release(self, data):
+        if not self.crop_active or data["button"] != "left":
+            return
+        # The drag ended, let the stages downstream see the final crop
+        self.crop_active = False
+        self.request_recompute()
 
-    def update_texture(self, img):
-        super().update_texture(img)
+    def draw_overlay(self):
         if self.crop_start and self.crop_end:
             # map image coords back to screen coords
             x0, y0 = self.crop_start
             x1, y1 = self.crop_end
-            h, w, _ = self.img.shape
+            h, w = self.crop_shape
             img_x, img_y = self.image_position
             img_w, img_h = self.scaled_size
 
@@ -82,4 +152,4 @@ class CropWidget(PipelineStageViewer):
             )
 
             dpg.draw_rectangle(pmin=p0, pmax=p1, color=(255, 255, 0, 255),
-                            fill=(255, 255, 0, 50), thickness=2, parent=self.drawlist)
+                            fill=(255, 255, 0, 50), thickness=2, parent=self.overlay_layer)
@@ -36,8 +36,10 @@
 import os
 import dearpygui.dearpygui as dpg
 import numpy as np
-from PIL import Image
 
+from negstation.processing import save_image
+from negstation.strip_writers import open_strip_writer
+from negstation.tiled_pipeline import TiledPipeline
 from .pipeline_stage_widget import PipelineStageWidget
 
 
@@ -54,6 +56,9 @@ class ExportStage(PipelineStageWidget):
         self._save_dialog_tag = dpg.generate_uuid()
         self._save_path = None
 
+        self.manager.bus.subscribe(
+            "process_full_res_tiled", self._on_process_full_res_tiled, worker=True)
+
     def create_pipeline_stage_content(self):
         # Button to pop up the file-save dialog
         dpg.add_button(label="Save As…",
@@ -106,37 +111,30 @@ class ExportStage(PipelineStageWidget):
             self.logger.warning("No export path set — click Save As… first")
             return
 
-        # Decide bit depth by extension
-        ext = os.path.splitext(self._save_path)[-1].lower()
-        # Convert floats → uint; or leave ints alone
-        if np.issubdtype(img.dtype, np.floating):
-            if ext in (".tif", ".tiff"):
-                arr = np.clip(img * 65535.0, 0, 65535).astype(np.uint16)
-            else:
-                arr = np.clip(img * 255.0, 0, 255).astype(np.uint8)
-        else:
-            arr = img
-
-        # Determine PIL mode
-        mode = None
-        if arr.ndim == 2:
-            mode = "L"
-        elif arr.ndim == 3:
-            c = arr.shape[2]
-            if c == 3:
-                mode = "RGB"
-            elif c == 4:
-                mode = "RGBA"
-
         try:
-            im = Image.fromarray(arr, mode) if mode else Image.fromarray(arr)
-
-            # JPEG doesn’t support alpha — drop it
-            if ext in (".jpg", ".jpeg") and im.mode == "RGBA":
-                im = im.convert("RGB")
-
-            im.save(self._save_path)
+            save_image(img, self._save_path)
         except Exception as e:
             self.logger.error(f"Failed to save image to {self._save_path}: {e}")
         else:
             self.logger.info(f"Saved full-resolution image to {self._save_path}")
+
+    def _on_process_full_res_tiled(self, data):
+        """
+        Runs the full-res chain feeding this stage in strips and writes them
+        out as they are computed, PNG and TIFF are streamed to disk.
+        """
+        if not self._save_path:
+            self.logger.warning("No export path set — click Save As… first")
+            return
+        path = self._save_path
+        tiled = TiledPipeline(self.manager.pipeline, self.logger)
+        try:
+            done = tiled.run(
+                self.pipeline_stage_in_id,
+                lambda w, h, c: open_strip_writer(path, w, h, c),
+            )
+        except Exception as e:
+            self.logger.error(f"Failed to save image to {path}: {e}")
+        else:
+            if done:
+                self.logger.info(f"Saved full-resolution image to {path}")
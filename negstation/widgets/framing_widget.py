@@ -1,7 +1,9 @@
 import dearpygui.dearpygui as dpg
 import numpy as np
 import time
-from scipy.ndimage import rotate
+from scipy.ndimage import affine_transform
+
+from negstation.processing import rotate_and_crop, to_float
 
 from .stage_viewer_widget import PipelineStageViewer
 
@@ -11,6 +13,7 @@ class FramingWidget(PipelineStageViewer):
     register = True
     has_pipeline_in = True
     has_pipeline_out = True
+    supports_tiles = True
 
     def __init__(self, manager, logger):
         super().__init__(manager, logger)
@@ -24,9 +27,8 @@ class FramingWidget(PipelineStageViewer):
         self._last_pub_time = 0.0
         self._publish_interval = 0.5  # seconds
 
-        self.manager.bus.subscribe("img_clicked", self.on_click)
-        self.manager.bus.subscribe("img_dragged", self.on_drag)
-        self.manager.bus.subscribe("img_scrolled", self.on_scroll)
+        self.manager.bus.subscribe("img_clicked", self.on_click, worker=True)
+        self.manager.bus.subscribe("img_dragged", self.on_drag, worker=True)
 
     def create_pipeline_stage_content(self):
         super().create_pipeline_stage_content()
@@ -34,18 +36,25 @@ class FramingWidget(PipelineStageViewer):
     def on_pipeline_data(self, img):
         if img is None:
             return
-        self.img = img.copy()
+        # A recompute feeds the same input again, its texture is still valid
+        if img is not self.img:
+            self.needs_update = True
+        self.img = img
         self._publish_rotated_and_cropped()
-        self.needs_update = True
 
-    def update_texture(self, img):
-        super().update_texture(img)
+    def on_full_res_pipeline_data(self, img):
+        if img is None:
+            return
+        h, w = img.shape[:2]
+        self.publish_stage(self.rotate_and_crop(img, self.angle, (0, 0, w, h)))
+
+    def draw_overlay(self):
         # Draw rotation guide if active
         if self.rot_start and self.rot_end:
             p0 = self._pos_to_canvas(self.rot_start)
             p1 = self._pos_to_canvas(self.rot_end)
             dpg.draw_line(p1=p0, p2=p1, color=(
-                255, 255, 0, 255), thickness=2, parent=self.drawlist)
+                255, 255, 0, 255), thickness=2, parent=self.overlay_layer)
 
     def on_click(self, data):
         if data.get("obj") is not self:
@@ -55,10 +64,11 @@ class FramingWidget(PipelineStageViewer):
         if button == "right":
             self.rot_start = (x, y)
             self.rot_end = (x, y)
-        self.needs_update = True
+        self.needs_overlay = True
 
     def on_drag(self, data):
-        if data.get("obj") is not self:
+        # Middle button drags pan the view
+        if data.get("obj") is not self or data.get("button") == "middle":
             return
         x, y = data.get("pos")
         button = data.get("button")
@@ -72,15 +82,24 @@ class FramingWidget(PipelineStageViewer):
         # Throttle publishes
         now = time.time()
         if now - self._last_pub_time >= self._publish_interval:
-            self._publish_rotated_and_cropped()
+            self.request_recompute()
             self._last_pub_time = now
-        self.needs_update = True
+        self.needs_overlay = True
+
+    def get_stage_params(self):
+        return self.angle
 
-    def on_scroll(self, data):
-        print(data)
+    def get_config(self):
+        config = super().get_config()
+        config["framing"] = {"angle": float(self.angle)}
+        return config
+
+    def set_config(self, config):
+        super().set_config(config)
+        self.angle = float(config.get("framing", {}).get("angle", 0.0))
 
     def _publish_rotated_and_cropped(self):
-        w, h, _ = self.img.shape
+        h, w = self.img.shape[:2]
         out = self.rotate_and_crop(self.img, self.angle, (0, 0, w, h))
         self.publish_stage(out)
 
@@ -98,21 +117,54 @@ class FramingWidget(PipelineStageViewer):
         rect: tuple[int, int, int, int],
         cval: float = 0.0
     ) -> np.ndarray:
-        h, w = img.shape[:2]
-        x, y, cw, ch = rect
-        rotated = np.empty_like(img)
-        for c in range(img.shape[2]):
-            rotated[..., c] = rotate(
-                img[..., c],
-                angle,
-                reshape=False,
-                order=1,              # bilinear interpolation
+        return rotate_and_crop(img, angle, rect, cval)
+
+    # Tiled full-res execution, equivalent to rotate() on the whole image
+
+    def _rotation_transform(self, shape: tuple):
+        """Returns matrix and offset mapping output to input (row, col) like rotate()"""
+        a = np.deg2rad(self.angle)
+        c, s = np.cos(a), np.sin(a)
+        matrix = np.array([[c, s], [-s, c]])
+        center = (np.asarray(shape[:2], dtype=np.float64) - 1) / 2
+        return matrix, center - matrix @ center
+
+    def get_tile_input_rect(self, rect, in_shape):
+        x0, y0, x1, y1 = rect
+        matrix, offset = self._rotation_transform(in_shape)
+        corners = np.array([[y0, x0], [y0, x1 - 1], [y1 - 1, x0], [y1 - 1, x1 - 1]])
+        src = corners @ matrix.T + offset
+        # Halo for the bilinear interpolation neighbours
+        halo = 2
+        (r0, c0), (r1, c1) = src.min(axis=0), src.max(axis=0)
+        return (
+            int(np.floor(c0)) - halo,
+            int(np.floor(r0)) - halo,
+            int(np.ceil(c1)) + halo + 1,
+            int(np.ceil(r1)) + halo + 1,
+        )
+
+    def process_tile(self, tile, in_rect, out_rect, in_shape):
+        matrix, offset = self._rotation_transform(in_shape)
+        out_origin = np.array([out_rect[1], out_rect[0]], dtype=np.float64)
+        in_origin = np.array([in_rect[1], in_rect[0]], dtype=np.float64)
+        tile_offset = matrix @ out_origin + offset - in_origin
+        out_shape = (out_rect[3] - out_rect[1], out_rect[2] - out_rect[0])
+        if tile.dtype == np.float16:
+            # scipy.ndimage has no float16 support
+            tile = to_float(tile)
+
+        out = np.empty(out_shape + tile.shape[2:], dtype=tile.dtype)
+        for c in range(tile.shape[2]):
+            affine_transform(
+                tile[..., c],
+                matrix,
+                offset=tile_offset,
+                output_shape=out_shape,
+                output=out[..., c],
+                order=1,
                 mode='constant',
-                cval=cval,
+                cval=0.0,
                 prefilter=False
             )
-        x0 = max(0, min(int(x), w - 1))
-        y0 = max(0, min(int(y), h - 1))
-        x1 = max(0, min(int(x + cw), w))
-        y1 = max(0, min(int(y + ch), h))
-        return rotated[y0:y1, x0:x1]
+        return out
@@ -1,5 +1,7 @@
 import dearpygui.dearpygui as dpg
 import numpy as np
+
+from negstation.processing import compute_histograms
 from .pipeline_stage_widget import PipelineStageWidget
 
 
@@ -16,6 +18,7 @@ class HistogramWidget(PipelineStageWidget):
         self.axis_y = dpg.generate_uuid()
         self.needs_redraw = False
         self.img = None
+        self.histograms = None
         self.series_tags = {
             "R": dpg.generate_uuid(),
             "G": dpg.generate_uuid(),
@@ -39,34 +42,19 @@ class HistogramWidget(PipelineStageWidget):
             return
 
         self.img = img
+        self.histograms = compute_histograms(img)
         self.needs_redraw = True
 
     def on_full_res_pipeline_data(self, img):
         pass
 
+    def has_update(self):
+        return self.needs_redraw and self.histograms is not None
+
     def update(self):
-        # TODO move calculations to on_pipeline_data
-        if not self.needs_redraw or self.img is None:
+        if not self.needs_redraw or self.histograms is None:
             return
 
         self.needs_redraw = False
-        img = np.clip(self.img, 0.0, 1.0)
-
-        r, g, b = img[..., 0], img[..., 1], img[..., 2]
-        luminance = 0.2126 * r + 0.7152 * g + 0.0722 * b
-
-        bins = 64
-        hist_range = (0.0, 1.0)
-        bin_edges = np.linspace(*hist_range, bins)
-
-        def compute_hist(channel):
-            hist, _ = np.histogram(channel, bins=bin_edges)
-            x = bin_edges[:-1]
-            y = np.log1p(hist)
-            y = y / np.max(y)
-            return x.tolist(), y.tolist()
-
-        dpg.set_value(self.series_tags["R"], compute_hist(r))
-        dpg.set_value(self.series_tags["G"], compute_hist(g))
-        dpg.set_value(self.series_tags["B"], compute_hist(b))
-        dpg.set_value(self.series_tags["L"], compute_hist(luminance))
+        for channel, series in self.histograms.items():
+            dpg.set_value(self.series_tags[channel], series)
@@ -1,6 +1,7 @@
 import dearpygui.dearpygui as dpg
 import numpy as np
 
+from negstation.processing import invert
 from .pipeline_stage_widget import PipelineStageWidget
 
 
@@ -9,6 +10,7 @@ class InvertStage(PipelineStageWidget):
     register = True
     has_pipeline_in = True
     has_pipeline_out = True
+    supports_tiles = True
 
     def __init__(self, manager, logger):
         super().__init__(manager, logger, default_stage_out="inverted_image")
@@ -19,6 +21,7 @@ class InvertStage(PipelineStageWidget):
     def on_pipeline_data(self, img):
         if img is None:
             return
-        inverted = img.copy()
-        inverted[...,:3] = 1.0 - inverted[...,:3]
-        self.publish_stage(inverted)
+        self.publish_stage(self.process_image(img))
+
+    def process_image(self, img):
+        return invert(img)
@@ -54,6 +54,9 @@ class LogWindowWidget(BaseWidget):
             self.handler = None
         super()._on_window_close()
 
+    def has_update(self):
+        return self.need_update
+
     def update(self):
         if self.need_update:
             self.update_counter += 1
@@ -1,6 +1,7 @@
 import dearpygui.dearpygui as dpg
 import numpy as np
 
+from negstation.processing import monochrome
 from .pipeline_stage_widget import PipelineStageWidget
 
 
@@ -9,6 +10,7 @@ class MonochromeStage(PipelineStageWidget):
     register = True
     has_pipeline_in = True
     has_pipeline_out = True
+    supports_tiles = True
 
     def __init__(self, manager, logger):
         super().__init__(manager, logger, default_stage_out="monochrome")
@@ -19,13 +21,7 @@ class MonochromeStage(PipelineStageWidget):
     def on_pipeline_data(self, img):
         if img is None:
             return
-        gray = img.copy()
-        rgb = gray[..., :3]
-        alpha = gray[..., 3:] if gray.shape[2] == 4 else np.ones_like(
-            rgb[..., :1])
+        self.publish_stage(self.process_image(img))
 
-        luminance = np.dot(rgb, [0.2126, 0.7152, 0.0722])[..., np.newaxis]
-        gray_rgba = np.concatenate(
-            [luminance, luminance, luminance, alpha], axis=-1)
-
-        self.publish_stage(gray_rgba.astype(np.float32))
+    def process_image(self, img):
+        return monochrome(img)
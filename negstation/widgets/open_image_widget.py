@@ -1,7 +1,10 @@
 import dearpygui.dearpygui as dpg
-from PIL import Image
 import numpy as np
 
+from negstation.disk_cache import file_key, get_disk_cache
+from negstation.image_files import SOURCE_EXTENSIONS, map_image, read_image
+from negstation.prefetch import Prefetcher, step_file
+from negstation.processing import build_pyramid, preview_from_pyramid, to_rgba
 from .pipeline_stage_widget import PipelineStageWidget
 
 
@@ -10,6 +13,10 @@ class OpenImageWidget(PipelineStageWidget):
     register = True
     has_pipeline_in = False
     has_pipeline_out = True
+    supports_tiles = True
+    extensions = SOURCE_EXTENSIONS["OpenImageWidget"]
+    # Number of files loaded ahead when stepping through a folder
+    prefetch_count = 2
 
     def __init__(self, manager, logger):
         super().__init__(manager, logger, default_stage_out="opened_image")
@@ -17,6 +24,19 @@ class OpenImageWidget(PipelineStageWidget):
         self.output_tag = dpg.generate_uuid()
         self.img = None
         self.img_full = None
+        # Image memory-mapped from the file itself, or once decoded from the
+        # disk cache
+        self.img_mapped = None
+        # Pyramid of the full image, level 0 is the mapped image itself
+        self.pyramid = None
+        self.disk_cache = get_disk_cache()
+        self.path = None
+        # Files are loaded on the worker pool, only the newest one is shown
+        self._job_id = 0
+
+        # Pyramids of the next files in the folder are loaded ahead
+        self.prefetcher = Prefetcher(manager.bus, logger)
+        self._step = 1
 
         self.manager.bus.subscribe(
             "process_full_res", self._on_process_full_res, True)
@@ -34,7 +54,10 @@ class OpenImageWidget(PipelineStageWidget):
                 "Image files {.png,.jpg,.jpeg,.bmp .gif,.tif,.tiff}",
             )
             dpg.add_file_extension(".*")
-        dpg.add_button(label="Open File...", callback=self._on_open_file)
+        with dpg.group(horizontal=True):
+            dpg.add_button(label="Open File...", callback=self._on_open_file)
+            dpg.add_button(label="<", callback=lambda: self._on_step(-1))
+            dpg.add_button(label=">", callback=lambda: self._on_step(1))
 
     def _on_open_file(self):
         dpg.configure_item(self.dialog_tag, show=True)
@@ -48,33 +71,114 @@ class OpenImageWidget(PipelineStageWidget):
         )
         if not selection:
             return
+        self._open(selection)
+
+    def _on_step(self, step: int):
+        """Opens the previous (-1) or next (1) image in the folder"""
+        if self.path is None:
+            return
+        files = step_file(self.path, self.extensions, step)
+        if files:
+            self._step = step
+            self._open(files[0])
+
+    def _pyramid_job(self, path: str):
+        """Returns the prefetch (key, loader) of the pyramid of a file"""
+        return file_key(path), lambda: self._load_pyramid(path)
+
+    def _load_pyramid(self, path: str):
+        """
+        Builds the pyramid of a file. The reduced levels are kept in the disk
+        cache, reopening the file maps them instead of reading the whole image.
+        """
+        def cached_level(level: int, compute: callable):
+            key = self.disk_cache.version_key(path, ("pyramid", level))
+            img = self.disk_cache.get(key)
+            if img is None:
+                img = self.disk_cache.put(key, compute())
+            return img
+
+        return build_pyramid(self._load_source(path), cache=cached_level)
+
+    def _open(self, selection: str):
+        """Starts loading a file in the background, superseding running loads"""
         self.logger.info(f"Selected file '{selection}'")
+        self.path = selection
+        self._job_id += 1
+        self.manager.bus.run_in_worker(self._load_job, (self._job_id, selection))
+
+    def _load_job(self, job):
+        job_id, path = job
+        if job_id != self._job_id:
+            # Superseded before it started
+            return
         try:
-            img = Image.open(selection).convert("RGBA")
-            rgba = np.asarray(img).astype(np.float32) / \
-                255.0  # normalize to [0,1]
-            h, w, _ = rgba.shape
-
-            # scale for small version
-            max_dim = 500
-            scale = min(1.0, max_dim / w, max_dim / h)
-            if scale < 1.0:
-                # convert to 0–255 uint8, resize with PIL, back to float32 [0–1]
-                pil = Image.fromarray(
-                    (rgba * 255).astype(np.uint8), mode="RGBA")
-                new_w, new_h = int(w * scale), int(h * scale)
-                pil = pil.resize((new_w, new_h), Image.LANCZOS)
-                rgba_small = np.asarray(pil).astype(np.float32) / 255.0
-                w_small, h_small = new_w, new_h
-
-            self.img_full = rgba
-            self.img = rgba_small
-
-            self.manager.pipeline.publish(
-                self.pipeline_stage_out_id, rgba_small)
+            # Built once, the preview and viewers pick a level from it
+            pyramid = self.prefetcher.load(*self._pyramid_job(path))
+            rgba_small = preview_from_pyramid(pyramid)
         except Exception as e:
-            self.logger.error(f"Failed to load image {selection}: {e}")
+            self.logger.error(f"Failed to load image {path}: {e}")
+            return
+        self.manager.bus.call_main(self._on_loaded, (job_id, path, pyramid, rgba_small))
+
+    def _on_loaded(self, data):
+        job_id, path, pyramid, rgba_small = data
+        if job_id != self._job_id:
+            return
+        self.pyramid = pyramid
+        # Level 0 is the memory-mapped image
+        self.img_mapped = pyramid[0]
+        self.manager.pipeline.set_pyramid(self.pipeline_stage_out_id, pyramid)
+
+        # The float image is only created when needed
+        self.img_full = None
+        self.img = rgba_small
+        self.manager.pipeline.publish(self.pipeline_stage_out_id, rgba_small)
+
+        # Load ahead in the direction we're stepping through the folder
+        self.prefetcher.prefetch([
+            self._pyramid_job(next_path)
+            for next_path in step_file(path, self.extensions, self._step, self.prefetch_count)
+        ])
+
+    def _load_source(self, path: str):
+        """Maps uncompressed TIFFs in place, other files are decoded once"""
+        img = map_image(path)
+        if img is None:
+            # Version 2 decodes 16 bit colour PNGs in full
+            img = self._load_cached(path, ("image16", 2), read_image)
+        return img
+
+    def _load_cached(self, path: str, params, load: callable):
+        """Returns load(path) from the disk cache, decoding it on a miss"""
+        key = self.disk_cache.key(path, params)
+        img = self.disk_cache.get(key)
+        if img is None:
+            img = self.disk_cache.put(key, load(path))
+        return img
+
+    def get_full_res(self):
+        if self.img_full is None and self.img_mapped is not None:
+            self.img_full = to_rgba(self.img_mapped)
+        return self.img_full
+
+    def request_recompute(self, full_res: bool = False):
+        img = self.get_full_res() if full_res else self.img
+        if img is not None:
+            self.manager.pipeline.publish(self.pipeline_stage_out_id, img, full_res)
+
+    def get_full_res_shape(self):
+        if self.img_full is not None:
+            return self.img_full.shape
+        return None if self.img_mapped is None else self.img_mapped.shape[:2] + (4,)
+
+    def read_full_res_tile(self, rect):
+        x0, y0, x1, y1 = rect
+        if self.img_full is not None:
+            return self.img_full[y0:y1, x0:x1]
+        # Only the rows of the tile are read from the memory-mapped file
+        return to_rgba(self.img_mapped[y0:y1, x0:x1])
 
     def _on_process_full_res(self, data):
         self.manager.pipeline.publish(
-            self.pipeline_stage_out_id, self.img_full, True)
+            self.pipeline_stage_out_id, self.get_full_res(), True)
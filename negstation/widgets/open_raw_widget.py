@@ -1,9 +1,17 @@
 import dearpygui.dearpygui as dpg
+import os
 import rawpy
 import numpy as np
-import ast
-from PIL import Image
+import time
 
+from negstation.disk_cache import file_key
+from negstation.image_files import SOURCE_EXTENSIONS
+from negstation.prefetch import Prefetcher, step_file
+from negstation.processing import preview_from_pyramid, to_rgba
+from negstation.raw_decoder import (
+    default_raw_config, get_decode_cache, parse_raw_config, postprocess_key,
+    serialize_raw_config
+)
 from .pipeline_stage_widget import PipelineStageWidget
 
 
@@ -12,36 +20,42 @@ class OpenRawWidget(PipelineStageWidget):
     register = True
     has_pipeline_in = False
     has_pipeline_out = True
+    supports_tiles = True
+    extensions = SOURCE_EXTENSIONS["OpenRawWidget"]
+    # Number of files decoded ahead when stepping through a folder
+    prefetch_count = 2
 
-    def __init__(self, manager, logger):
-        super().__init__(manager, logger, default_stage_out="opened_raw")
+    def __init__(self, manager, logger, default_stage_out="opened_raw"):
+        super().__init__(manager, logger, default_stage_out=default_stage_out)
         self.dialog_tag = dpg.generate_uuid()
         self.output_tag = dpg.generate_uuid()
         self.config_group = dpg.generate_uuid()
         self.busy_group = dpg.generate_uuid()
+        self.status_tag = dpg.generate_uuid()
         self.raw_path = None
         self.img = None
         self.img_full = None
-        self.rawconfig = {
-            # Demosaic algorithm
-            "demosaic_algorithm": rawpy.DemosaicAlgorithm.AHD,
-            # Output color space
-            "output_color":       rawpy.ColorSpace.sRGB,
-            # Bits per sample
-            "output_bps":         16,
-            # White balance
-            "use_camera_wb":      True,
-            "use_auto_wb":        False,
-            "user_wb":            (1.0, 1.0, 1.0, 1.0),
-            # Brightness/exposure
-            "bright":             1.0,
-            "no_auto_bright":     False,
-            # Gamma correction (you’ll pass (1.0, config["gamma"]) down)
-            "gamma":              1.0,
-            # Size & quality toggles
-            "half_size":          False,
-            "four_color_rgb":     False,
-        }
+        # Full-res image memory-mapped from the disk cache, for tiled reads
+        self.img_mapped = None
+        # Preview pyramid, level 0 is the half-size decode or the thumbnail
+        self.pyramid = None
+        self.rawconfig = default_raw_config()
+        # Settings of the newest preview decode job, full-res decodes use
+        # them too so they match the preview until Reprocess is pressed
+        self.decoded_rawconfig = None
+        self.decode_cache = get_decode_cache()
+        # Preview from the embedded thumbnail instead of a half-size decode
+        self.use_thumbnail = False
+
+        # Decoding runs on the worker pool, only the newest job is published
+        self._job_id = 0
+        self._status = None
+        self._status_since = 0.0
+        self._status_shown = False
+
+        # Previews of the next files in the folder are decoded ahead
+        self.prefetcher = Prefetcher(manager.bus, logger)
+        self._step = 1
 
         self.demosaic_combo_tag    = dpg.generate_uuid()
         self.color_space_combo_tag = dpg.generate_uuid()
@@ -56,9 +70,10 @@ class OpenRawWidget(PipelineStageWidget):
         self.gamma_slider_tag      = dpg.generate_uuid()
         self.half_size_tag         = dpg.generate_uuid()
         self.four_color_tag        = dpg.generate_uuid()
+        self.thumbnail_tag         = dpg.generate_uuid()
 
         self.manager.bus.subscribe(
-            "process_full_res", self._on_process_full_res, True)
+            "process_full_res", self._on_process_full_res, worker=True)
 
     def create_pipeline_stage_content(self):
         with dpg.file_dialog(
@@ -79,6 +94,8 @@ class OpenRawWidget(PipelineStageWidget):
             with dpg.group(horizontal=True):
                 dpg.add_button(label="Open File...", callback=self._on_open_file)
                 dpg.add_button(label="Reprocess",  callback=self._process_and_publish)
+                dpg.add_button(label="<", callback=lambda: self._on_step(-1))
+                dpg.add_button(label=">", callback=lambda: self._on_step(1))
 
             # -- Demosaic combo --
             dpg.add_combo(
@@ -195,9 +212,16 @@ class OpenRawWidget(PipelineStageWidget):
                 ),
                 tag=self.four_color_tag
             )
+            dpg.add_checkbox(
+                label="Preview from thumbnail",
+                default_value=self.use_thumbnail,
+                callback=lambda s,a,u: setattr(self, "use_thumbnail", a),
+                tag=self.thumbnail_tag
+            )
 
-        with dpg.group(tag=self.busy_group, show=False):
-            dpg.add_text("Processing...")
+        with dpg.group(tag=self.busy_group, show=False, horizontal=True):
+            dpg.add_text("Processing...", tag=self.status_tag)
+            dpg.add_button(label="Cancel", callback=self._on_cancel)
 
     def _on_open_file(self):
         dpg.configure_item(self.dialog_tag, show=True)
@@ -215,98 +239,167 @@ class OpenRawWidget(PipelineStageWidget):
         self.logger.info(f"Selected file '{selection}'")
         self._process_and_publish()
 
+    def _on_step(self, step: int):
+        """Opens the previous (-1) or next (1) RAW file in the folder"""
+        if self.raw_path is None:
+            return
+        files = step_file(self.raw_path, self.extensions, step)
+        if not files:
+            return
+        self._step = step
+        self.raw_path = files[0]
+        self.logger.info(f"Selected file '{self.raw_path}'")
+        self._process_and_publish()
+
+    def _pyramid_job(self, path: str, rawconfig: dict, use_thumbnail: bool):
+        """Returns the prefetch (key, loader) of the preview pyramid of a file"""
+        # Keyed by the file version, a file rewritten in place is decoded again
+        key = (file_key(path), postprocess_key(rawconfig), use_thumbnail)
+        return key, lambda: self.decode_cache.decode_pyramid(
+            path, rawconfig, use_thumbnail=use_thumbnail
+        )
+
     def _process_and_publish(self):
+        """Starts decoding the preview in the background, superseding running jobs"""
         if self.raw_path is None:
             return
+        self._job_id += 1
+        self.img_full = None
+        self.img_mapped = None
+        self.decoded_rawconfig = dict(self.rawconfig)
+        job = (self._job_id, self.raw_path, self.decoded_rawconfig, self.use_thumbnail)
+        self._set_status(f"Decoding {os.path.basename(self.raw_path)}")
+        self.manager.bus.run_in_worker(self._decode_job, job)
+
+    def _decode_job(self, job):
+        job_id, path, rawconfig, use_thumbnail = job
+        if job_id != self._job_id:
+            # Cancelled or superseded before it started
+            return
         self.logger.info("Processing RAW image")
+        try:
+            # Only the preview is decoded now, full-res is decoded when needed
+            pyramid = self.prefetcher.load(
+                *self._pyramid_job(path, rawconfig, use_thumbnail)
+            )
+            rgba_small = preview_from_pyramid(pyramid)
+        except Exception as e:
+            self.logger.error(f"Failed to decode {path}: {e}")
+            if job_id == self._job_id:
+                self._set_status(None)
+            return
+        # LibRaw can't be interrupted, a cancelled decode is discarded here
+        if job_id != self._job_id:
+            self.logger.info(f"Discarded superseded decode of {path}")
+            return
 
-        dpg.configure_item(self.config_group, show=False)
-        dpg.configure_item(self.busy_group, show=True)
-
-        with rawpy.imread(self.raw_path) as raw:
-            # Prepare postprocess kwargs from config
-            postprocess_args = {
-                'demosaic_algorithm': self.rawconfig["demosaic_algorithm"],
-                'output_color':       self.rawconfig["output_color"],
-                'output_bps':         self.rawconfig["output_bps"],
-                'bright':             self.rawconfig["bright"],
-                'no_auto_bright':     self.rawconfig["no_auto_bright"],
-                'gamma':              (1.0, self.rawconfig["gamma"]),
-                'half_size':          self.rawconfig["half_size"],
-                'four_color_rgb':     self.rawconfig["four_color_rgb"],
-            }
-
-            if self.rawconfig["use_camera_wb"]:
-                postprocess_args['use_camera_wb'] = True
-            elif self.rawconfig["use_auto_wb"]:
-                postprocess_args['use_auto_wb'] = True
-            else:
-                postprocess_args['user_wb'] = self.rawconfig["user_wb"]
-
-            # Postprocess into RGB
-            rgb = raw.postprocess(**postprocess_args)
-
-        # Normalize to float32 in 0.0-1.0 range depending on output_bps
-        max_val = (2 ** self.rawconfig["output_bps"]) - 1
-        rgb_float = rgb.astype(np.float32) / max_val
-
-        # Add alpha channel (fully opaque)
-        h, w, _ = rgb_float.shape
-        alpha = np.ones((h, w, 1), dtype=np.float32)
-
-        rgba = np.concatenate([rgb_float, alpha], axis=2)
-
-        # scale for small version
-        max_dim = 500
-        scale = min(1.0, max_dim / w, max_dim / h)
-        if scale < 1.0:
-            # convert to 0–255 uint8, resize with PIL, back to float32 [0–1]
-            pil = Image.fromarray((rgba * 255).astype(np.uint8), mode="RGBA")
-            new_w, new_h = int(w * scale), int(h * scale)
-            pil = pil.resize((new_w, new_h), Image.LANCZOS)
-            rgba_small = np.asarray(pil).astype(np.float32) / 255.0
-            w_small, h_small = new_w, new_h
-
-        self.img_full = rgba
+        self.img_full = None
+        self.img_mapped = None
         self.img = rgba_small
-
+        self.pyramid = pyramid
+        self.manager.pipeline.set_pyramid(self.pipeline_stage_out_id, pyramid)
+        self._set_status(None)
         self.manager.pipeline.publish(self.pipeline_stage_out_id, rgba_small)
-        dpg.configure_item(self.config_group, show=True)
-        dpg.configure_item(self.busy_group, show=False)
+
+        # Decode ahead in the direction we're stepping through the folder
+        self.prefetcher.prefetch([
+            self._pyramid_job(next_path, rawconfig, use_thumbnail)
+            for next_path in step_file(path, self.extensions, self._step, self.prefetch_count)
+        ])
+
+    def _on_cancel(self):
+        self._job_id += 1
+        self._set_status(None)
+
+    def _set_status(self, status):
+        """Shows status with the elapsed time below the settings, None hides it"""
+        self._status = status
+        self._status_since = time.time()
+
+    def has_update(self):
+        # The elapsed time is shown while busy
+        return self._status is not None or self._status_shown
+
+    def update(self):
+        status = self._status
+        if status is not None:
+            dpg.set_value(
+                self.status_tag, f"{status}... {time.time() - self._status_since:.1f}s"
+            )
+        if self._status_shown != (status is not None):
+            self._status_shown = status is not None
+            dpg.configure_item(self.busy_group, show=self._status_shown)
+
+    def get_full_res(self):
+        """Returns the full-res image, demosaicing it on first use"""
+        if self.img_full is None and self.raw_path is not None:
+            self.logger.info("Decoding full-res RAW image")
+            self._set_status("Decoding full-res")
+            try:
+                self.img_full = self.decode_cache.decode(
+                    self.raw_path, self._full_res_rawconfig()
+                )
+            finally:
+                self._set_status(None)
+        return self.img_full
+
+    def _full_res_rawconfig(self):
+        if self.decoded_rawconfig is None:
+            # Nothing was decoded yet
+            return dict(self.rawconfig)
+        return self.decoded_rawconfig
+
+    def request_recompute(self, full_res: bool = False):
+        img = self.get_full_res() if full_res else self.img
+        if img is not None:
+            self.manager.pipeline.publish(self.pipeline_stage_out_id, img, full_res)
+
+    def _get_mapped(self):
+        if self.img_mapped is None and self.raw_path is not None:
+            self._set_status("Decoding full-res")
+            try:
+                self.img_mapped = self.decode_cache.decode_mapped(
+                    self.raw_path, self._full_res_rawconfig()
+                )
+            finally:
+                self._set_status(None)
+        return self.img_mapped
+
+    def get_full_res_shape(self):
+        if self.img_full is not None:
+            return self.img_full.shape
+        img = self._get_mapped()
+        return None if img is None else img.shape[:2] + (4,)
+
+    def read_full_res_tile(self, rect):
+        x0, y0, x1, y1 = rect
+        if self.img_full is not None:
+            return self.img_full[y0:y1, x0:x1]
+        # Only the rows of the tile are read from the memory-mapped file
+        return to_rgba(self._get_mapped()[y0:y1, x0:x1])
 
     def _on_process_full_res(self, data):
-        if self.img_full is None:
+        img = self.get_full_res()
+        if img is None:
             return
-        self.manager.pipeline.publish(
-            self.pipeline_stage_out_id, self.img_full, True)
-        
+        self.manager.pipeline.publish(self.pipeline_stage_out_id, img, True)
+
+
     def get_config(self):
         config = super().get_config()
-        config["raw_config"] = { k:str(v) for k, v in self.rawconfig.items() }
+        config["raw_config"] = serialize_raw_config(self.rawconfig)
+        config["raw_preview"] = {"use_thumbnail": str(self.use_thumbnail)}
         return config
 
     def set_config(self, config):
         super().set_config(config)
+        preview_cfg = config.get("raw_preview", {})
+        self.use_thumbnail = preview_cfg.get("use_thumbnail", "False") == "True"
+        dpg.set_value(self.thumbnail_tag, self.use_thumbnail)
         raw_cfg = config.get("raw_config", {})
         if raw_cfg:
             # parse each back into Python types
-            for k, v in raw_cfg.items():
-                if k == "demosaic_algorithm":
-                    # "DemosaicAlgorithm.AHD" → "AHD"
-                    name = v.split(".", 1)[1]
-                    self.rawconfig[k] = rawpy.DemosaicAlgorithm[name]
-                elif k == "output_color":
-                    name = v.split(".", 1)[1]
-                    self.rawconfig[k] = rawpy.ColorSpace[name]
-                elif k == "output_bps":
-                    self.rawconfig[k] = int(v)
-                elif k in ("use_camera_wb","use_auto_wb",
-                           "no_auto_bright","half_size","four_color_rgb"):
-                    self.rawconfig[k] = (v == "True")
-                elif k in ("bright","gamma"):
-                    self.rawconfig[k] = float(v)
-                elif k == "user_wb":
-                    self.rawconfig[k] = tuple(ast.literal_eval(v))
+            self.rawconfig.update(parse_raw_config(raw_cfg))
 
             # now that rawconfig is back to real types, update the UI
             self._update_raw_ui()
@@ -1,6 +1,7 @@
 import dearpygui.dearpygui as dpg
 import numpy as np
 
+from negstation.processing import orient, rot90_k
 from .pipeline_stage_widget import PipelineStageWidget
 
 
@@ -9,6 +10,7 @@ class OrientationStage(PipelineStageWidget):
     register = True
     has_pipeline_in = True
     has_pipeline_out = True
+    supports_tiles = True
 
     def __init__(self, manager, logger):
         super().__init__(manager, logger, default_stage_out="oriented_image")
@@ -20,8 +22,6 @@ class OrientationStage(PipelineStageWidget):
         self.rotation_combo_tag = dpg.generate_uuid()
         self.mirror_h_tag = dpg.generate_uuid()
         self.mirror_v_tag = dpg.generate_uuid()
-
-        self.last_image = None
     
     def create_pipeline_stage_content(self):
         dpg.add_combo(
@@ -54,38 +54,52 @@ class OrientationStage(PipelineStageWidget):
             "270°": 270
         }
         self.rotation = degree_map.get(value, 0)
-        self.on_pipeline_data(self.last_img)
+        self.request_recompute()
 
     def _on_mirror_h_change(self, sender, value, user_data):
         self.mirror_h = value
-        self.on_pipeline_data(self.last_img)
+        self.request_recompute()
 
     def _on_mirror_v_change(self, sender, value, user_data):
         self.mirror_v = value
-        self.on_pipeline_data(self.last_img)
+        self.request_recompute()
 
     def on_pipeline_data(self, img):
         if img is None:
             return
-
-        self.last_img = img
-        img_out = img.copy()
-
-        # Apply rotation
-        if self.rotation == 90:
-            img_out = np.rot90(img_out, k=3)
-        elif self.rotation == 180:
-            img_out = np.rot90(img_out, k=2)
-        elif self.rotation == 270:
-            img_out = np.rot90(img_out, k=1)
-
-        # Apply mirroring
-        if self.mirror_h:
-            img_out = np.fliplr(img_out)
+        self.publish_stage(self.process_image(img))
+
+    def process_image(self, img):
+        return orient(img, self.rotation, self.mirror_h, self.mirror_v)
+
+    def get_tile_output_shape(self, in_shape):
+        h, w = in_shape[:2]
+        if self.rotation in (90, 270):
+            h, w = w, h
+        return (h, w) + tuple(in_shape[2:])
+
+    def get_tile_input_rect(self, rect, in_shape):
+        # A rotated/mirrored rectangle is a rectangle, so process_image()
+        # works on tiles as is. Undo the mirroring first, then the rotation.
+        x0, y0, x1, y1 = rect
+        h, w = in_shape[:2]
+        oh, ow = self.get_tile_output_shape(in_shape)[:2]
         if self.mirror_v:
-            img_out = np.flipud(img_out)
-
-        self.publish_stage(img_out)
+            y0, y1 = oh - y1, oh - y0
+        if self.mirror_h:
+            x0, x1 = ow - x1, ow - x0
+
+        k = rot90_k(self.rotation)
+        if k == 1:
+            return (w - y1, x0, w - y0, x1)
+        if k == 2:
+            return (w - x1, h - y1, w - x0, h - y0)
+        if k == 3:
+            return (y0, h - x1, y1, h - x0)
+        return (x0, y0, x1, y1)
+
+    def get_stage_params(self):
+        return (self.rotation, self.mirror_h, self.mirror_v)
 
     def get_config(self):
         config = super().get_config()
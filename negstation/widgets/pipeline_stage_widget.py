@@ -8,6 +8,8 @@ class PipelineStageWidget(BaseWidget):
     register = False
     has_pipeline_in: bool = False
     has_pipeline_out: bool = False
+    # Whether the stage implements the tile functions below, see TiledPipeline
+    supports_tiles: bool = False
 
     def __init__(
         self,
@@ -25,19 +27,28 @@ class PipelineStageWidget(BaseWidget):
         self.stage_in_combo = dpg.generate_uuid()
         self.stage_out_input = dpg.generate_uuid()
         self._last_full = False
+        # Generation of the input currently being processed
+        self._generation = None
 
         if self.has_pipeline_out:
             self.pipeline_stage_out_id = self.manager.pipeline.register_stage(
                 default_stage_out
             )
+            self.manager.bus.subscribe(
+                "pipeline_recompute", self._on_recompute_request, worker=True
+            )
 
         self.manager.bus.subscribe("pipeline_stages", self._on_stage_list, True)
         if self.has_pipeline_in:
             self.pipeline_stage_in_id = 0
-            self.manager.bus.subscribe("pipeline_stage", self._on_stage_data, True)
+            # Stage computation runs on the worker pool, not the render loop
+            self.manager.bus.subscribe(
+                "pipeline_stage", self._on_stage_data, worker=True
+            )
             self.manager.bus.subscribe(
-                "pipeline_stage_full", self._on_stage_data_full, True
+                "pipeline_stage_full", self._on_stage_data_full, worker=True
             )
+        self._connect_stage()
         # force getting all available pipeline stages
         self.manager.pipeline.republish_stages()
 
@@ -72,14 +83,103 @@ class PipelineStageWidget(BaseWidget):
         raise NotImplementedError
 
     def on_pipeline_data(self, img: np.ndarray):
-        """Must be implemented by the widget, is called when there is a new image published on the in stage"""
+        """
+        Must be implemented by the widget, is called on the worker pool when
+        there is a new image published on the in stage. GUI updates must be
+        deferred to update() or self.manager.bus.call_main(). The image is a
+        read-only view shared with other stages, write results into a new
+        array instead of copying the input first.
+        """
         pass
 
+    def process_image(self, img: np.ndarray):
+        """Can be implemented by pointwise stages, returns the processed image"""
+        raise NotImplementedError
+
+    # Tiled full-res execution
+
+    def get_tile_output_shape(self, in_shape: tuple):
+        """Returns the output image shape for an input image shape"""
+        return in_shape
+
+    def get_tile_input_rect(self, rect: tuple, in_shape: tuple):
+        """
+        Returns the (x0, y0, x1, y1) rectangle of the input needed to compute
+        the output rectangle rect, including any halo
+        """
+        return rect
+
+    def process_tile(self, tile: np.ndarray, in_rect: tuple, out_rect: tuple, in_shape: tuple):
+        """
+        Computes the output tile for out_rect from the input tile covering
+        in_rect. Pointwise stages only need to implement process_image()
+        """
+        return self.process_image(tile)
+
+    def get_full_res_shape(self):
+        """Must be implemented by tiled sources, returns the full-res image shape"""
+        raise NotImplementedError
+
+    def read_full_res_tile(self, rect: tuple):
+        """Must be implemented by tiled sources, returns a full-res image region"""
+        raise NotImplementedError
+
+    def get_stage_params(self):
+        """
+        Can be implemented by the widget, returns a hashable value of all
+        parameters that influence the output image. Used to skip recomputing
+        a stage when neither its input nor its parameters changed.
+        """
+        return None
+
+    def request_recompute(self, full_res: bool = False):
+        """
+        Call after a stage parameter changed. Recomputes this stage from its
+        current input, the published result then only reaches the stages
+        downstream of this one. Source widgets override it to republish, it
+        is also called on them when their output got evicted from the
+        pipeline cache. A preview recompute starts a new generation, so
+        results still being computed here or downstream with the old
+        parameters are discarded.
+        """
+        if not (self.has_pipeline_in and self.has_pipeline_out):
+            return
+        pipeline = self.manager.pipeline
+        if full_res:
+            # Only preview recomputes mark stages dirty, forget the last
+            # full-res computation so it isn't skipped as unchanged
+            pipeline.forget_computed(self.pipeline_stage_out_id, True, outdated=True)
+        else:
+            pipeline.mark_dirty(self.pipeline_stage_out_id)
+            pipeline.new_generation(self.pipeline_stage_out_id)
+        self._recompute(full_res)
+
+    def _recompute(self, full_res: bool):
+        """
+        Computes this stage again from the current input image. If the input
+        got evicted too it is recomputed first and reaches us when published.
+        """
+        pipeline = self.manager.pipeline
+        sid = self.pipeline_stage_in_id
+        if full_res:
+            img = pipeline.get_stage_data_full(sid)
+            callback = self._on_stage_data_full
+        else:
+            img = pipeline.get_stage_data(sid)
+            callback = self._on_stage_data
+        if img is not None:
+            data = (sid, img, pipeline.get_stage_version(sid, full_res),
+                    pipeline.get_generation(sid, full_res))
+            self.manager.bus.run_in_worker(callback, data)
+
     def publish_stage(self, img):
-        """Publishes an image to output stage"""
+        """Publishes an image to output stage, the image must not be modified afterwards"""
         if self.has_pipeline_out:
             self.manager.pipeline.publish(
-                self.pipeline_stage_out_id, img, full_res=self._last_full
+                self.pipeline_stage_out_id,
+                img,
+                full_res=self._last_full,
+                generation=self._generation,
             )
 
     def get_config(self):
@@ -97,8 +197,18 @@ class PipelineStageWidget(BaseWidget):
                 self.pipeline_stage_in_id = config["pipeline_config"]["stage_in"]
             if self.has_pipeline_out:
                 self.pipeline_stage_out_id = config["pipeline_config"]["stage_out"]
+            self._connect_stage()
         self._update_ui_from_state()
 
+    def _connect_stage(self):
+        """Tells the pipeline which stage feeds our output stage"""
+        if self.has_pipeline_out:
+            self.manager.pipeline.set_processor(self.pipeline_stage_out_id, self)
+            if self.has_pipeline_in:
+                self.manager.pipeline.connect(
+                    self.pipeline_stage_out_id, self.pipeline_stage_in_id
+                )
+
     def _update_ui_from_state(self):
         """
         Refresh the ‘Stage In’ combo (and ‘Stage Out’ input) so
@@ -149,21 +259,75 @@ class PipelineStageWidget(BaseWidget):
         id = int(d[1])
         self.pipeline_stage_in_id = id
         if self.has_pipeline_in:
-            img = self.manager.pipeline.get_stage_data(id)
-            self.on_pipeline_data(img)
+            self._connect_stage()
+            pipeline = self.manager.pipeline
+            if self.has_pipeline_out:
+                # Results computed from the previous input are outdated
+                pipeline.new_generation(self.pipeline_stage_out_id)
+            self.manager.bus.run_in_worker(
+                self._on_stage_data,
+                (id, pipeline.get_stage_data(id), pipeline.get_stage_version(id),
+                 pipeline.get_generation(id)),
+            )
+
+    def _is_stale(self, pipeline_id, generation, full_res):
+        """
+        Whether an input image is outdated, i.e. a newer generation was
+        started at the stage that produced it or upstream of it. Generations
+        started here or downstream don't make newer input stale.
+        """
+        return self.manager.pipeline.is_stale(pipeline_id, generation, full_res)
+
+    def _start_generation(self, generation, full_res):
+        """
+        Returns the generation a computation on our input publishes with.
+        Every computation of an output stage starts its own, so only newer
+        computations of this stage or upstream ones supersede its result.
+        """
+        if not self.has_pipeline_out:
+            return generation
+        return self.manager.pipeline.new_generation(self.pipeline_stage_out_id, full_res)
+
+    def _should_compute(self, version, full_res):
+        if not self.has_pipeline_out:
+            return True
+        return self.manager.pipeline.should_compute(
+            self.pipeline_stage_out_id, version, self.get_stage_params(), full_res
+        )
+
+    def _on_recompute_request(self, data):
+        stage_id, full_res = data
+        if stage_id != self.pipeline_stage_out_id:
+            return
+        if self.has_pipeline_in:
+            # Our output got evicted, nothing changed. The same input and
+            # params republish it with the same version, so the stages
+            # downstream don't recompute.
+            self.manager.pipeline.forget_computed(stage_id, full_res)
+            self._recompute(full_res)
+        else:
+            self.request_recompute(full_res)
 
     def _on_stage_data(self, data):
-        pipeline_id = data[0]
-        img = data[1]
+        pipeline_id, img, version, generation = data
         if self.has_pipeline_in and pipeline_id == self.pipeline_stage_in_id:
+            if self._is_stale(pipeline_id, generation, False):
+                return
+            if not self._should_compute(version, False):
+                return
             self._last_full = False
+            self._generation = self._start_generation(generation, False)
             self.on_pipeline_data(img)
 
     def _on_stage_data_full(self, data):
-        pipeline_id = data[0]
-        img = data[1]
+        pipeline_id, img, version, generation = data
         if self.has_pipeline_in and pipeline_id == self.pipeline_stage_in_id:
+            if self._is_stale(pipeline_id, generation, True):
+                return
+            if not self._should_compute(version, True):
+                return
             self._last_full = True
+            self._generation = self._start_generation(generation, True)
             if hasattr(self, "on_full_res_pipeline_data"):
                 self.on_full_res_pipeline_data(img)
             else:
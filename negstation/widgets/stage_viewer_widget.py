@@ -1,5 +1,9 @@
 import dearpygui.dearpygui as dpg
+import math
 import numpy as np
+
+from negstation.processing import fit_image, to_texture_data
+from negstation.view_tiles import ViewTiles
 from .pipeline_stage_widget import PipelineStageWidget
 
 
@@ -8,17 +12,35 @@ class PipelineStageViewer(PipelineStageWidget):
     register = True
     has_pipeline_in = True
     has_pipeline_out = False
+    # Zoom relative to fitting the image in the window, per wheel step
+    zoom_step = 1.25
+    max_zoom = 64.0
 
     def __init__(self, manager, logger):
         super().__init__(manager, logger, default_stage_in="pipeline_out")
         self.texture_tag = dpg.generate_uuid()
+        # Size of the texture and its data, reused until the size changes
+        self.texture_size = (1, 1)
+        self.texture_data = None
         self.drawlist = None
         self.img = None
         self.registry = manager.texture_registry
         self.needs_update = False
+        # Only the overlay changed, e.g. a guide being dragged
+        self.needs_overlay = False
+        self.image_layer = None
+        self.overlay_layer = None
         self.canvas_handler = None
+        # Size and position of the whole image on the canvas, which is larger
+        # than the canvas when zoomed in
         self.scaled_size = (0, 0)
         self.image_position = (0, 0)
+        self.zoom = 1.0
+        # Image point in the middle of the canvas, relative to the image size
+        self.view_center = (0.5, 0.5)
+        self._pan_anchor = None
+        # Full-res tiles shown when zoomed in beyond the stage image
+        self.view_tiles = ViewTiles(manager, logger)
 
         self.manager.bus.subscribe("mouse_dragged", self._on_mouse_drag, False)
         self.manager.bus.subscribe("mouse_scrolled", self._on_mouse_scroll, False)
@@ -29,9 +51,11 @@ class PipelineStageViewer(PipelineStageWidget):
             1, 1, [0, 0, 0, 0], tag=self.texture_tag, parent=self.registry
         )
 
-        # Add drawlist
+        # Add drawlist, the overlay is drawn above the image and can be
+        # redrawn without touching the image texture
         with dpg.drawlist(width=-1, height=-1) as self.drawlist:
-            pass
+            self.image_layer = dpg.add_draw_layer()
+            self.overlay_layer = dpg.add_draw_layer()
 
         # Register click handler
         with dpg.item_handler_registry() as self.canvas_handler:
@@ -39,6 +63,9 @@ class PipelineStageViewer(PipelineStageWidget):
         dpg.bind_item_handler_registry(self.drawlist, self.canvas_handler)
 
     def on_canvas_click(self, sender, app_data, user_data):
+        if app_data[0] == 2:
+            # Middle button drags pan the view
+            self._pan_anchor = self.view_center
         mouse_x, mouse_y = dpg.get_mouse_pos(local=False)
         canvas_x, canvas_y = dpg.get_item_rect_min(self.drawlist)
         local_x = mouse_x - canvas_x
@@ -76,6 +103,17 @@ class PipelineStageViewer(PipelineStageWidget):
         local_x = mouse_x - canvas_x
         local_y = mouse_y - canvas_y
 
+        if data["button"] == "middle" and self._pan_anchor is not None:
+            # The delta is counted from where the drag started, only drags
+            # starting in this canvas pan it
+            dx, dy = data["delta"]
+            if self._in_canvas(local_x - dx, local_y - dy):
+                self._pan(data["delta"])
+            else:
+                # Left over from an earlier click here
+                self._pan_anchor = None
+            return
+
         img_x, img_y = self.image_position
         img_w, img_h = self.scaled_size
 
@@ -117,6 +155,8 @@ class PipelineStageViewer(PipelineStageWidget):
             # calculate the image coordinate
             x = int((local_x - img_x) * self.img.shape[1] / img_w)
             y = int((local_y - img_y) * self.img.shape[0] / img_h)
+            if self._in_canvas(local_x, local_y):
+                self._zoom_at(local_x, local_y, self.zoom_step ** data)
             self.manager.bus.publish_deferred(
                 "img_scrolled",
                 {
@@ -127,11 +167,42 @@ class PipelineStageViewer(PipelineStageWidget):
                 },
             )
 
+    def _in_canvas(self, local_x, local_y):
+        return 0 <= local_x < self.window_width and 0 <= local_y < self.window_height
+
+    def _zoom_at(self, local_x, local_y, factor):
+        """Zooms by factor keeping the image point under the mouse in place"""
+        zoom = min(max(self.zoom * factor, 1.0), self.max_zoom)
+        img_x, img_y = self.image_position
+        img_w, img_h = self.scaled_size
+        if zoom == self.zoom or img_w <= 0 or img_h <= 0:
+            return
+        # Relative image point under the mouse
+        fx = (local_x - img_x) / img_w
+        fy = (local_y - img_y) / img_h
+        new_w = img_w * zoom / self.zoom
+        new_h = img_h * zoom / self.zoom
+        self.zoom = zoom
+        self.view_center = (
+            fx + (self.window_width / 2 - local_x) / new_w,
+            fy + (self.window_height / 2 - local_y) / new_h,
+        )
+        self.needs_update = True
+
+    def _pan(self, delta):
+        """Moves the view by the mouse movement since the drag started"""
+        img_w, img_h = self.scaled_size
+        if img_w <= 0 or img_h <= 0:
+            return
+        cx, cy = self._pan_anchor
+        self.view_center = (cx - delta[0] / img_w, cy - delta[1] / img_h)
+        self.needs_update = True
+
     def on_resize(self, width, height):
         self.needs_update = True
 
     def on_pipeline_data(self, img):
-        if img is None:
+        if img is None or img is self.img:
             return
         self.img = img
         self.needs_update = True
@@ -139,52 +210,167 @@ class PipelineStageViewer(PipelineStageWidget):
     def on_full_res_pipeline_data(self, img):
         pass
 
+    def _display_image(self, img: np.ndarray, rect: tuple, disp_w: float, disp_h: float):
+        """
+        Returns the region rect (x0, y0, x1, y1) of the image at the
+        resolution it is shown at, so uploads scale with the window size.
+        The region comes from the pyramid of the stage when it has one, and
+        from full-res tiles when zoomed in beyond the pixels of the image.
+        """
+        px_w = max(1, int(disp_w * self.manager.display_scale))
+        px_h = max(1, int(disp_h * self.manager.display_scale))
+        x0, y0, x1, y1 = rect
+        h, w = img.shape[:2]
+        # Size of the whole image at which the region has enough pixels
+        needed = max(w, h) * max(px_w / (x1 - x0), px_h / (y1 - y0))
+
+        src = img
+        level = self.manager.pipeline.get_pyramid_level(
+            self.pipeline_stage_in_id, math.ceil(needed))
+        if level is not None:
+            lh, lw = level.shape[:2]
+            # Only a pyramid of the same image, e.g. not of a rotated one
+            if abs(lw * h - lh * w) <= 0.01 * lw * h:
+                src = level
+        if src is img and needed > max(w, h) and self.zoom > 1.0:
+            full = self._full_res_region(img, rect, px_w * px_h)
+            if full is not None:
+                return fit_image(full, px_w, px_h)
+
+        sy, sx = src.shape[0] / h, src.shape[1] / w
+        region = src[round(y0 * sy):round(y1 * sy), round(x0 * sx):round(x1 * sx)]
+        return fit_image(np.asarray(region), px_w, px_h)
+
+    # Full-res tiles are only computed for regions up to this many times
+    # the displayed pixels, the preview is upscaled at lower zooms
+    max_tile_oversampling = 4
+
+    def _full_res_region(self, img: np.ndarray, rect: tuple, px_count: int):
+        """
+        Returns the region rect of the image from full-res tiles, or None
+        while they are computed or if the stage has no full-res tier
+        """
+        sid = self.pipeline_stage_in_id
+        if sid is None:
+            return None
+        version = self.manager.pipeline.get_stage_version(sid)
+        shape = self.view_tiles.full_shape(sid, version, self._on_tiles_ready)
+        if shape is None:
+            return None
+        sy, sx = shape[0] / img.shape[0], shape[1] / img.shape[1]
+        x0, y0, x1, y1 = rect
+        full_rect = (
+            int(x0 * sx),
+            int(y0 * sy),
+            min(shape[1], math.ceil(x1 * sx)),
+            min(shape[0], math.ceil(y1 * sy)),
+        )
+        area = (full_rect[2] - full_rect[0]) * (full_rect[3] - full_rect[1])
+        if area > self.max_tile_oversampling * px_count:
+            return None
+        return self.view_tiles.get_region(sid, version, full_rect, self._on_tiles_ready)
+
+    def _on_tiles_ready(self):
+        self.needs_update = True
+
+    def _view_offset(self, size: float, win: float, center: float):
+        """Returns the clamped view center and the image offset of an axis"""
+        if size <= win:
+            return 0.5, (win - size) / 2
+        half = win / 2 / size
+        center = min(max(center, half), 1.0 - half)
+        return center, win / 2 - center * size
+
     def update_texture(self, img: np.ndarray):
         if img is None:
             return
 
-        h, w, _ = img.shape
-        flat = img.flatten().tolist()
+        # The display size follows the stage image, which mouse positions
+        # are mapped to, the texture can have another resolution
+        win_w, win_h = self.window_width, self.window_height
+        if win_w <= 0 or win_h <= 0:
+            return
+        img_h, img_w = img.shape[:2]
+        scale = min(win_w / img_w, win_h / img_h) * self.zoom
+        disp_w = img_w * scale
+        disp_h = img_h * scale
+        cx, x_off = self._view_offset(disp_w, win_w, self.view_center[0])
+        cy, y_off = self._view_offset(disp_h, win_h, self.view_center[1])
+        self.view_center = (cx, cy)
 
-        # Replace texture
-        if dpg.does_item_exist(self.texture_tag):
-            dpg.delete_item(self.texture_tag)
-        dpg.add_dynamic_texture(
-            width=w,
-            height=h,
-            default_value=flat,
-            tag=self.texture_tag,
-            parent=self.registry,
-        )
+        # Only the visible part of the image is uploaded
+        x0 = max(0, math.floor(-x_off / scale))
+        y0 = max(0, math.floor(-y_off / scale))
+        x1 = min(img_w, math.ceil((win_w - x_off) / scale))
+        y1 = min(img_h, math.ceil((win_h - y_off) / scale))
+        if x1 <= x0 or y1 <= y0:
+            return
 
-        win_w, win_h = self.window_width, self.window_height
-        scale = min(win_w / w, win_h / h)
-        disp_w = int(w * scale)
-        disp_h = int(h * scale)
+        tex = self._display_image(
+            img, (x0, y0, x1, y1), (x1 - x0) * scale, (y1 - y0) * scale)
+        h, w, _ = tex.shape
+        self.texture_data = to_texture_data(tex, self.texture_data)
 
-        x_off = (win_w - disp_w) / 2
-        y_off = (win_h - disp_h) / 2
+        if self.texture_size == (w, h):
+            # Copied to the existing texture, no Python lists involved
+            dpg.set_value(self.texture_tag, self.texture_data)
+        else:
+            # Textures have a fixed size, a new one replaces the old one
+            old_tag = self.texture_tag
+            self.texture_tag = dpg.generate_uuid()
+            dpg.add_dynamic_texture(
+                width=w,
+                height=h,
+                default_value=self.texture_data,
+                tag=self.texture_tag,
+                parent=self.registry,
+            )
+            self.texture_size = (w, h)
+            if dpg.does_item_exist(old_tag):
+                dpg.delete_item(old_tag)
 
         self.scaled_size = (disp_w, disp_h)
         self.image_position = (x_off, y_off)
 
         # Clear old drawings
-        dpg.delete_item(self.drawlist, children_only=True)
+        dpg.delete_item(self.image_layer, children_only=True)
 
         # Draw image
         dpg.draw_image(
             self.texture_tag,
-            pmin=(x_off, y_off),
-            pmax=(x_off + disp_w, y_off + disp_h),
+            pmin=(x_off + x0 * scale, y_off + y0 * scale),
+            pmax=(x_off + x1 * scale, y_off + y1 * scale),
             uv_min=(0, 0),
             uv_max=(1, 1),
-            parent=self.drawlist,
+            parent=self.image_layer,
         )
 
         # Resize drawlist
         dpg.configure_item(self.drawlist, width=win_w, height=win_h)
 
+        # The image moved or changed size, the overlay follows it
+        self.redraw_overlay()
+
+    def draw_overlay(self):
+        """
+        Can be implemented by viewers, draws guides on self.overlay_layer in
+        canvas coordinates, see image_position and scaled_size
+        """
+        pass
+
+    def redraw_overlay(self):
+        dpg.delete_item(self.overlay_layer, children_only=True)
+        if self.img is not None:
+            self.draw_overlay()
+
+    def has_update(self):
+        return self.needs_update or self.needs_overlay
+
     def update(self):
         if self.needs_update:
             self.needs_update = False
+            self.needs_overlay = False
             self.update_texture(self.img)
+        elif self.needs_overlay:
+            self.needs_overlay = False
+            self.redraw_overlay()
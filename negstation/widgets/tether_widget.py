@@ -0,0 +1,136 @@
+import dearpygui.dearpygui as dpg
+import os
+
+from negstation.capture import CaptureSession, open_camera
+from .open_raw_widget import OpenRawWidget
+
+
+class TetherWidget(OpenRawWidget):
+    """
+    Captures RAW frames from a tethered camera and publishes their previews.
+    Frames are saved to a directory and decoded on the worker pool while the
+    next frame is captured, when decoding falls behind only the newest frame
+    is previewed.
+    """
+
+    name = "Tethered Capture"
+    register = True
+
+    def __init__(self, manager, logger):
+        # 'gphoto2' or a directory of RAW files replayed by a fake camera
+        self.camera_source = "gphoto2"
+        self.save_dir = os.path.expanduser("~/negstation_captures")
+        self.frame_count = 1
+        self.session = None
+        self._session_source = None
+        self._capture_status = ""
+
+        self.camera_input_tag = dpg.generate_uuid()
+        self.save_dir_input_tag = dpg.generate_uuid()
+        self.frames_input_tag = dpg.generate_uuid()
+        self.capture_status_tag = dpg.generate_uuid()
+        super().__init__(manager, logger, default_stage_out="captured_raw")
+
+    def create_pipeline_stage_content(self):
+        dpg.add_input_text(
+            label="Camera",
+            hint="gphoto2 or a directory to replay",
+            default_value=self.camera_source,
+            callback=lambda s, a, u: setattr(self, "camera_source", a),
+            tag=self.camera_input_tag,
+        )
+        dpg.add_input_text(
+            label="Save to",
+            default_value=self.save_dir,
+            callback=lambda s, a, u: setattr(self, "save_dir", a),
+            tag=self.save_dir_input_tag,
+        )
+        with dpg.group(horizontal=True):
+            dpg.add_input_int(
+                label="Frames",
+                default_value=self.frame_count,
+                min_value=1,
+                min_clamped=True,
+                width=90,
+                callback=lambda s, a, u: setattr(self, "frame_count", a),
+                tag=self.frames_input_tag,
+            )
+            dpg.add_button(label="Capture", callback=self._on_capture)
+            dpg.add_button(label="Stop", callback=self._on_stop)
+        dpg.add_text("", tag=self.capture_status_tag)
+        dpg.add_separator()
+        super().create_pipeline_stage_content()
+
+    def _on_capture(self):
+        if self.session is not None and self.session.is_running():
+            return
+        if self.session is None or self._session_source != self.camera_source:
+            self._close_session()
+            try:
+                camera = open_camera(self.camera_source)
+            except Exception as e:
+                self.logger.error(f"Failed to open camera '{self.camera_source}': {e}")
+                return
+            self.session = CaptureSession(
+                camera, self.save_dir, self._on_frame, self.logger
+            )
+            self._session_source = self.camera_source
+        self.session.out_dir = self.save_dir
+        self.session.start(self.frame_count)
+
+    def _on_stop(self):
+        if self.session is not None:
+            self.session.stop()
+
+    def _on_frame(self, path: str):
+        """Called on the capture thread, hands the frame to the main thread"""
+        self.manager.bus.call_main(self._open_frame, path)
+
+    def _open_frame(self, path: str):
+        """Queues the decoding of a captured frame"""
+        self.raw_path = path
+        self._process_and_publish()
+
+    def _close_session(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+    def _format_capture_status(self):
+        if self.session is None:
+            return ""
+        state = "capturing" if self.session.is_running() else "idle"
+        return f"{self.session.captured} frames captured, {state}"
+
+    def has_update(self):
+        return super().has_update() or self._format_capture_status() != self._capture_status
+
+    def update(self):
+        super().update()
+        status = self._format_capture_status()
+        if status != self._capture_status:
+            self._capture_status = status
+            dpg.set_value(self.capture_status_tag, status)
+
+    def _on_window_close(self):
+        self._close_session()
+        return super()._on_window_close()
+
+    def get_config(self):
+        config = super().get_config()
+        config["tether"] = {
+            "camera": self.camera_source,
+            "save_dir": self.save_dir,
+            "frames": self.frame_count,
+        }
+        return config
+
+    def set_config(self, config):
+        super().set_config(config)
+        tether = config.get("tether", {})
+        self.camera_source = tether.get("camera", self.camera_source)
+        self.save_dir = tether.get("save_dir", self.save_dir)
+        self.frame_count = int(tether.get("frames", self.frame_count))
+        dpg.set_value(self.camera_input_tag, self.camera_source)
+        dpg.set_value(self.save_dir_input_tag, self.save_dir)
+        dpg.set_value(self.frames_input_tag, self.frame_count)
@@ -0,0 +1,8 @@
+#!/usr/bin/env python3
+
+import sys
+
+from negstation import batch
+
+if __name__ == "__main__":
+    sys.exit(batch.main())
@@ -0,0 +1,8 @@
+#!/usr/bin/env python3
+
+import sys
+
+from negstation import benchmark
+
+if __name__ == "__main__":
+    sys.exit(benchmark.main())
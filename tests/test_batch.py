@@ -0,0 +1,85 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import tifffile
+from PIL import Image
+
+from negstation import batch
+
+
+def _layout(*stages):
+    """A saved layout of an Open Image widget followed by stages and an export"""
+    widgets = [{
+        "widget_type": "OpenImageWidget",
+        "config": {"pipeline_config": {"stage_in": None, "stage_out": 0}},
+    }]
+    for i, (widget_type, config) in enumerate(stages):
+        config = dict(config, pipeline_config={"stage_in": i, "stage_out": i + 1})
+        widgets.append({"widget_type": widget_type, "config": config})
+    widgets.append({
+        "widget_type": "ExportStage",
+        "config": {"pipeline_config": {"stage_in": len(stages), "stage_out": None}},
+    })
+    return {
+        "pipeline_order": {str(i): f"stage {i}" for i in range(len(stages) + 1)},
+        "widgets": widgets,
+    }
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.input_dir = os.path.join(self.tmp.name, "in")
+        self.output_dir = os.path.join(self.tmp.name, "out")
+        os.makedirs(self.input_dir)
+
+    def _run(self, layout, *args):
+        layout_path = os.path.join(self.tmp.name, "layout.json")
+        with open(layout_path, "w") as f:
+            json.dump(layout, f)
+        return batch.main([
+            self.input_dir, self.output_dir, "--layout", layout_path, "--jobs", "1",
+            *args,
+        ])
+
+    def test_default_format_is_16_bit_tiff(self):
+        img = np.random.default_rng(0).integers(0, 65536, (40, 60, 3), dtype=np.uint16)
+        tifffile.imwrite(os.path.join(self.input_dir, "scan.tif"), img)
+
+        self.assertEqual(self._run(_layout(("InvertStage", {}))), 0)
+
+        out = tifffile.imread(os.path.join(self.output_dir, "scan.tif"))
+        self.assertEqual(out.dtype, np.uint16)
+        self.assertEqual(out.shape, (40, 60, 4))
+        # 16 bit precision survives the float pipeline
+        np.testing.assert_allclose(out[..., :3], 65535 - img.astype(np.int64), atol=1)
+        self.assertTrue((out[..., 3] == 65535).all())
+
+    def test_crop(self):
+        img = np.zeros((100, 200, 3), dtype=np.uint8)
+        Image.fromarray(img).save(os.path.join(self.input_dir, "scan.png"))
+        crop = {"crop": {"start": [10, 5], "end": [60, 40], "shape": [50, 100]}}
+
+        self.assertEqual(self._run(_layout(("CropWidget", crop))), 0)
+
+        out = tifffile.imread(os.path.join(self.output_dir, "scan.tif"))
+        self.assertEqual(out.shape[:2], (70, 100))
+
+    def test_shared_stems_dont_overwrite(self):
+        img = np.zeros((8, 8, 3), dtype=np.uint8)
+        Image.fromarray(img).save(os.path.join(self.input_dir, "a.png"))
+        Image.fromarray(img + 255).save(os.path.join(self.input_dir, "a.tif"))
+        Image.fromarray(img).save(os.path.join(self.input_dir, "b.png"))
+
+        self.assertEqual(self._run(_layout(), "--format", "png"), 0)
+
+        self.assertEqual(sorted(os.listdir(self.output_dir)), ["a_png.png", "a_tif.png", "b.png"])
+        self.assertEqual(np.asarray(Image.open(os.path.join(self.output_dir, "a_tif.png"))).min(), 255)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import logging
+import threading
+import time
+import unittest
+
+from negstation.event_bus import EventBus
+
+
+def wait_idle(bus: EventBus, timeout: float = 5.0):
+    end = time.perf_counter() + timeout
+    while not bus.is_idle():
+        if time.perf_counter() > end:
+            raise TimeoutError("event bus didn't become idle")
+        time.sleep(0.001)
+
+
+def pump_until(bus: EventBus, condition: callable, timeout: float = 5.0):
+    """Runs the main thread callbacks like the render loop until condition()"""
+    end = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > end:
+            raise TimeoutError("condition not met")
+        bus.process_main_queue()
+        time.sleep(0.001)
+
+
+class Recorder:
+    """Worker handler that records the payloads and how many calls overlap"""
+
+    def __init__(self, delay: float = 0.0, barrier: threading.Barrier = None):
+        self.delay = delay
+        self.barrier = barrier
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def handle(self, data):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        if self.barrier is not None:
+            self.barrier.wait()
+        time.sleep(self.delay)
+        with self.lock:
+            self.calls.append(data)
+            self.running -= 1
+
+
+class EventBusTest(unittest.TestCase):
+    def setUp(self):
+        self.bus = EventBus(logging.getLogger(__name__), workers=4)
+
+    def test_coalescing_keeps_newest_payload(self):
+        received = []
+        self.bus.set_coalescing("dragged")
+        self.bus.subscribe("dragged", received.append, main_thread=True)
+        for i in range(200):
+            self.bus.publish_deferred("dragged", i)
+        pump_until(self.bus, lambda: received and received[-1] == 199)
+
+        # At most one payload waits in the event queue and one in the main
+        # queue while nothing is handled
+        self.assertLessEqual(len(received), 2)
+        # Every payload is either handled or counted as dropped
+        self.assertEqual(len(received) + self.bus.get_dropped_counts().get("dragged", 0), 200)
+
+    def test_coalescing_per_key(self):
+        received = []
+        self.bus.set_coalescing("stage", key=lambda d: d[0])
+        self.bus.subscribe("stage", received.append, main_thread=True)
+        for i in range(50):
+            self.bus.publish_deferred("stage", (0, i))
+            self.bus.publish_deferred("stage", (1, i))
+        pump_until(self.bus, lambda: (0, 49) in received and (1, 49) in received)
+
+        for key in (0, 1):
+            payloads = [d for d in received if d[0] == key]
+            self.assertEqual(payloads, sorted(payloads))
+            self.assertLessEqual(len(payloads), 2)
+        self.assertEqual(
+            len(received) + self.bus.get_dropped_counts().get("stage", 0), 100)
+
+    def test_worker_calls_serialized_per_owner(self):
+        recorder = Recorder(delay=0.002)
+        self.bus.subscribe("job", recorder.handle, worker=True)
+        for i in range(20):
+            self.bus.publish_deferred("job", i)
+        wait_idle(self.bus)
+
+        self.assertEqual(recorder.max_running, 1)
+        self.assertEqual(recorder.calls, list(range(20)))
+
+    def test_worker_owners_run_in_parallel(self):
+        # Both handlers have to run at the same time to pass the barrier
+        barrier = threading.Barrier(2, timeout=2)
+        recorders = [Recorder(barrier=barrier) for _ in range(2)]
+        for recorder in recorders:
+            self.bus.subscribe("job", recorder.handle, worker=True)
+        self.bus.publish_deferred("job", 0)
+        wait_idle(self.bus)
+
+        self.assertFalse(barrier.broken)
+        self.assertEqual([r.calls for r in recorders], [[0], [0]])
+
+    def test_coalesced_worker_jobs(self):
+        recorder = Recorder(delay=0.01)
+        self.bus.set_coalescing("stage", key=lambda d: d[0])
+        self.bus.subscribe("stage", recorder.handle, worker=True)
+        for i in range(20):
+            self.bus.publish_deferred("stage", (0, i))
+        wait_idle(self.bus)
+
+        self.assertEqual(recorder.calls[-1], (0, 19))
+        self.assertLess(len(recorder.calls), 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
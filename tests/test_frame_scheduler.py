@@ -0,0 +1,71 @@
+import logging
+import time
+import unittest
+
+from negstation.event_bus import EventBus
+from negstation.frame_scheduler import FrameScheduler
+
+
+class FakeWidget:
+    def __init__(self, dirty=False, refresh=False):
+        self.dirty = dirty
+        self.refresh = refresh
+        self.updates = 0
+
+    def has_update(self):
+        return self.dirty
+
+    def refresh_due(self):
+        return self.refresh
+
+    def update(self):
+        self.updates += 1
+        self.dirty = False
+
+
+class FrameSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.bus = EventBus(logging.getLogger(__name__), workers=1)
+        self.scheduler = FrameScheduler(self.bus, idle_fps=10, idle_after=0.05)
+
+    def _frames_in(self, seconds: float, widgets: list):
+        start = time.perf_counter()
+        frames = 0
+        while time.perf_counter() - start < seconds:
+            self.scheduler.run_frame(widgets)
+            self.scheduler.wait()
+            frames += 1
+        return frames
+
+    def test_idle_frame_rate(self):
+        self._frames_in(0.1, [])
+        self.assertLessEqual(self._frames_in(0.5, []), 7)
+
+    def test_timed_refresh_doesnt_prevent_idling(self):
+        widget = FakeWidget(refresh=True)
+        self._frames_in(0.1, [widget])
+        frames = self._frames_in(0.5, [widget])
+        self.assertLessEqual(frames, 7)
+        # Still refreshed in every idle frame
+        self.assertGreaterEqual(widget.updates, frames)
+
+    def test_pending_update_keeps_full_rate(self):
+        widget = FakeWidget()
+        self._frames_in(0.1, [widget])
+        widget.dirty = True
+        self.scheduler.run_frame([widget])
+        self.assertEqual(widget.updates, 1)
+        start = time.perf_counter()
+        self.scheduler.wait()
+        self.assertLess(time.perf_counter() - start, 0.01)
+
+    def test_main_queue_budget_carries_over(self):
+        for _ in range(20):
+            self.bus.call_main(lambda data: time.sleep(0.002))
+        self.scheduler.run_frame([])
+        self.assertGreater(self.bus.main_queue.qsize(), 0)
+        self.assertEqual(self.scheduler.get_stats()["carried_over"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
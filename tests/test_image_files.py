@@ -0,0 +1,128 @@
+import os
+import struct
+import tempfile
+import unittest
+import zlib
+
+import numpy as np
+import tifffile
+
+from negstation.image_files import ChunkedTiff, map_image, read_image
+from negstation.processing import to_rgba
+from negstation.strip_writers import TIFFStripWriter
+
+
+class ScatteredTIFFWriter(TIFFStripWriter):
+    """Leaves a gap before every strip, so the strips aren't contiguous"""
+
+    def write_strip(self, strip):
+        self.file.write(b"\x00" * 6)
+        super().write_strip(strip)
+
+
+def write_png16(path: str, img: np.ndarray):
+    """Writes a 16 bit RGB or RGBA PNG, alternating the Sub and Up filters"""
+    h, w, c = img.shape
+    bpp = 2 * c
+    data = img.astype(">u2").reshape(h, -1).view(np.uint8).astype(np.int32)
+    rows = []
+    for y in range(h):
+        if y % 2:
+            filtered = data[y] - data[y - 1]
+            kind = 2
+        else:
+            filtered = data[y] - np.concatenate([np.zeros(bpp, np.int32), data[y, :-bpp]])
+            kind = 1
+        rows.append(bytes([kind]) + (filtered % 256).astype(np.uint8).tobytes())
+
+    def chunk(kind, payload):
+        return struct.pack(">I", len(payload)) + kind + payload + struct.pack(
+            ">I", zlib.crc32(kind + payload))
+
+    header = struct.pack(">IIBBBBB", w, h, 16, {3: 2, 4: 6}[c], 0, 0, 0)
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", header))
+        f.write(chunk(b"IDAT", zlib.compress(b"".join(rows))))
+        f.write(chunk(b"IEND", b""))
+
+
+class ReadImageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_png16_keeps_16_bits(self):
+        for channels in (3, 4):
+            with self.subTest(channels=channels):
+                rng = np.random.default_rng(channels)
+                img = rng.integers(0, 65536, (30, 41, channels), dtype=np.uint16)
+                path = os.path.join(self.tmp.name, f"rgb{channels}.png")
+                write_png16(path, img)
+
+                decoded = read_image(path)
+                self.assertEqual(decoded.dtype, np.uint16)
+                np.testing.assert_array_equal(decoded, img)
+                self.assertTrue((decoded > 255).any())
+                # The working format is converted from the 16 bit values
+                np.testing.assert_allclose(
+                    to_rgba(decoded)[..., :3], img[..., :3] / 65535, atol=1e-6)
+
+
+class ChunkedTiffTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.img = np.random.default_rng(0).integers(0, 65536, (45, 70, 3), dtype=np.uint16)
+        self.path = os.path.join(self.tmp.name, "scan.tif")
+
+    def _check_slices(self, mapped, img):
+        np.testing.assert_array_equal(np.asarray(mapped), img)
+        for key in (
+            (slice(10, 30), slice(5, 60)),
+            (slice(0, 45, 3), slice(1, 70, 4)),
+            (slice(17, 18), slice(15, 49)),
+            (slice(40, 100), slice(60, None)),
+            (5, slice(None)),
+            (slice(None), 69),
+        ):
+            with self.subTest(key=key):
+                np.testing.assert_array_equal(mapped[key], img[key])
+
+    def test_tiled(self):
+        # Separate planes are passed as samples x rows x columns
+        for planarconfig, data in (("contig", self.img),
+                                   ("separate", np.moveaxis(self.img, -1, 0))):
+            with self.subTest(planarconfig=planarconfig):
+                tifffile.imwrite(self.path, data, tile=(16, 16), photometric="rgb",
+                                 planarconfig=planarconfig)
+                mapped = map_image(self.path)
+                self.assertIsInstance(mapped, ChunkedTiff)
+                self.assertEqual(mapped.shape, self.img.shape)
+                self._check_slices(mapped, self.img)
+
+    def test_grey_tiled_read_as_rgb(self):
+        grey = self.img[..., 0]
+        tifffile.imwrite(self.path, grey, tile=(16, 32))
+        mapped = map_image(self.path)
+        self.assertEqual(mapped.shape, self.img.shape)
+        self._check_slices(mapped, np.repeat(grey[..., None], 3, axis=2))
+
+    def test_scattered_strips(self):
+        writer = ScatteredTIFFWriter(self.path, 70, 45, 3)
+        for y in range(0, 45, 8):
+            writer.write(self.img[y:y + 8])
+        writer.close()
+        mapped = map_image(self.path)
+        self.assertIsInstance(mapped, ChunkedTiff)
+        self._check_slices(mapped, self.img)
+
+    def test_contiguous_strips_mapped_directly(self):
+        tifffile.imwrite(self.path, self.img, photometric="rgb", rowsperstrip=8)
+        mapped = map_image(self.path)
+        self.assertIsInstance(mapped, np.memmap)
+        np.testing.assert_array_equal(mapped, self.img)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import logging
+import sys
+import threading
+import unittest
+
+import numpy as np
+
+from negstation.event_bus import EventBus
+from negstation.image_pipeline import ImagePipeline
+
+
+class ImagePipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.bus = EventBus(logging.getLogger(__name__), workers=1)
+        self.pipeline = ImagePipeline(self.bus)
+        self.source = self.pipeline.register_stage("source")
+        self.stage = self.pipeline.register_stage("stage")
+        self.pipeline.connect(self.stage, self.source)
+        self.img = np.zeros((4, 4, 4), np.float32)
+
+    def test_republishing_keeps_version(self):
+        p = self.pipeline
+        p.publish(self.source, self.img)
+        p.publish(self.source, self.img)
+        self.assertEqual(p.get_stage_version(self.source), 1)
+        p.publish(self.source, self.img.copy())
+        self.assertEqual(p.get_stage_version(self.source), 2)
+
+        # Recomputed from the same input version and params, e.g. after eviction
+        for _ in range(2):
+            self.assertTrue(p.should_compute(self.stage, 2, "params"))
+            p.publish(self.stage, self.img.copy(), generation=p.new_generation(self.stage))
+            p.forget_computed(self.stage)
+        self.assertEqual(p.get_stage_version(self.stage), 1)
+
+        # A parameter change publishes a new version
+        p.mark_dirty(self.stage)
+        p.should_compute(self.stage, 2, "params")
+        p.publish(self.stage, self.img.copy(), generation=p.new_generation(self.stage))
+        self.assertEqual(p.get_stage_version(self.stage), 2)
+
+    def test_pixel_format_change_publishes_new_version(self):
+        p = self.pipeline
+        p.publish(self.source, self.img)
+        p.pixel_dtype = "float16"
+        p.publish(self.source, self.img)
+        self.assertEqual(p.get_stage_version(self.source), 2)
+        self.assertEqual(p.get_stage_data(self.source).dtype, np.float16)
+
+    def test_upstream_generation_makes_result_stale(self):
+        p = self.pipeline
+        p.publish(self.source, self.img)
+        generation = p.new_generation(self.stage)
+        self.assertFalse(p.is_stale(self.stage, generation))
+
+        # A new source image supersedes the computation
+        p.publish(self.source, self.img.copy())
+        self.assertTrue(p.is_stale(self.stage, generation))
+        self.assertFalse(p.publish(self.stage, self.img, generation=generation))
+        self.assertIsNone(p.get_stage_data(self.stage))
+        self.assertEqual(p.get_cache_stats()["stale_dropped"], 1)
+
+    def test_downstream_generation_doesnt_make_input_stale(self):
+        p = self.pipeline
+        p.publish(self.source, self.img)
+        generation = p.get_generation(self.source)
+        p.new_generation(self.stage)
+        self.assertFalse(p.is_stale(self.source, generation))
+
+    def test_newer_computation_supersedes_older(self):
+        p = self.pipeline
+        older = p.new_generation(self.stage)
+        newer = p.new_generation(self.stage)
+        self.assertTrue(p.publish(self.stage, self.img, generation=newer))
+        self.assertFalse(p.publish(self.stage, self.img, generation=older))
+
+    def test_downstream_order(self):
+        p = self.pipeline
+        branch = p.register_stage("branch")
+        leaf = p.register_stage("leaf")
+        p.connect(leaf, self.stage)
+        p.connect(branch, self.source)
+        self.assertEqual(p.downstream(self.source), [self.stage, branch, leaf])
+        p.mark_dirty(self.stage)
+        self.assertTrue(p.is_dirty(leaf))
+        self.assertFalse(p.is_dirty(branch))
+
+    def test_concurrent_graph_changes(self):
+        p = self.pipeline
+        stages = [p.register_stage(f"stage {i}") for i in range(20)]
+        errors = []
+        # Switch threads often so the workers interleave with the iteration
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, interval)
+
+        def rewire():
+            try:
+                for i in range(100000):
+                    p.connect(stages[i % 20], self.stage if i // 20 % 2 else None)
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=rewire)
+        thread.start()
+        try:
+            while thread.is_alive():
+                p.mark_dirty(self.source)
+                p.should_compute(self.stage, 1)
+                p.is_stale(stages[0], 0)
+        except RuntimeError as e:
+            errors.append(e)
+        thread.join()
+        self.assertEqual(errors, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
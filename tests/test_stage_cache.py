@@ -0,0 +1,43 @@
+import unittest
+
+import numpy as np
+
+from negstation.stage_cache import StageCache
+
+
+class StageCacheTest(unittest.TestCase):
+    def test_shared_buffer_counted_once(self):
+        cache = StageCache(10**6)
+        img = np.zeros((100, 100, 4), np.float32)
+        cache.put("a", img)
+        cache.put("b", img[10:20])
+        view = img.view()
+        view.flags.writeable = False
+        cache.put("c", view)
+        self.assertEqual(cache.get_stats()["bytes_held"], img.nbytes)
+
+        cache.discard("a")
+        cache.discard("c")
+        self.assertEqual(cache.get_stats()["bytes_held"], img.nbytes)
+        cache.discard("b")
+        self.assertEqual(cache.get_stats()["bytes_held"], 0)
+
+    def test_eviction_frees_budget(self):
+        size = np.zeros((10, 10), np.uint8).nbytes
+        cache = StageCache(2 * size)
+        for key in range(3):
+            cache.put(key, np.zeros((10, 10), np.uint8))
+        stats = cache.get_stats()
+        self.assertIsNone(cache.get(0))
+        self.assertEqual((stats["entries"], stats["bytes_held"]), (2, 2 * size))
+
+    def test_custom_sizeof(self):
+        cache = StageCache(100, sizeof=len)
+        cache.put("a", [0] * 60)
+        cache.put("b", [0] * 60)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get_stats()["bytes_held"], 60)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import tifffile
+from PIL import Image
+
+from negstation.strip_writers import (
+    PILStripWriter, PNGStripWriter, TIFFStripWriter, open_strip_writer
+)
+
+
+def write_strips(path: str, img: np.ndarray, rows: int):
+    h, w = img.shape[:2]
+    channels = 1 if img.ndim == 2 else img.shape[2]
+    writer = open_strip_writer(path, w, h, channels)
+    for y in range(0, h, rows):
+        writer.write(img[y:y + rows])
+    writer.close()
+    return writer
+
+
+class StripWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.rng = np.random.default_rng(0)
+
+    def _path(self, name: str):
+        return os.path.join(self.tmp.name, name)
+
+    def test_png_round_trip(self):
+        for shape in ((37, 50), (37, 50, 2), (37, 50, 3), (37, 50, 4)):
+            with self.subTest(shape=shape):
+                img = self.rng.integers(0, 256, shape, dtype=np.uint8)
+                writer = write_strips(self._path("out.png"), img, 8)
+                self.assertIsInstance(writer, PNGStripWriter)
+                np.testing.assert_array_equal(
+                    np.asarray(Image.open(self._path("out.png"))), img)
+
+    def test_tiff_round_trip(self):
+        for shape in ((37, 50), (37, 50, 3), (37, 50, 4)):
+            with self.subTest(shape=shape):
+                img = self.rng.integers(0, 65536, shape, dtype=np.uint16)
+                writer = write_strips(self._path("out.tif"), img, 8)
+                self.assertIsInstance(writer, TIFFStripWriter)
+                np.testing.assert_array_equal(tifffile.imread(self._path("out.tif")), img)
+
+    def test_float_strips_converted(self):
+        img = self.rng.random((20, 30, 3), dtype=np.float32)
+        write_strips(self._path("out.tif"), img, 7)
+        out = tifffile.imread(self._path("out.tif"))
+        self.assertEqual(out.dtype, np.uint16)
+        np.testing.assert_allclose(out / 65535, img, atol=1 / 65535)
+
+        write_strips(self._path("out.png"), img, 7)
+        out = np.asarray(Image.open(self._path("out.png")))
+        np.testing.assert_allclose(out / 255, img, atol=1 / 255)
+
+    def test_pil_fallback(self):
+        img = self.rng.integers(0, 256, (20, 30, 3), dtype=np.uint8)
+        writer = write_strips(self._path("out.bmp"), img, 6)
+        self.assertIsInstance(writer, PILStripWriter)
+        np.testing.assert_array_equal(np.asarray(Image.open(self._path("out.bmp"))), img)
+
+
+if __name__ == "__main__":
+    unittest.main()